@@ -1,336 +1,746 @@
 import streamlit as st
 import json
 from datetime import datetime
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Callable
 import sqlite3
+import threading
+import queue
+import time
+import atexit
+from concurrent.futures import Future
+from functools import partial
+import importlib
 import os
 
+# Ordered schema migrations; each version is applied once and recorded in schema_version
+SCHEMA_MIGRATIONS = [
+    (1, [
+        '''
+        CREATE TABLE IF NOT EXISTS attendance_logs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id TEXT,
+            action TEXT,
+            timestamp DATETIME,
+            location TEXT,
+            status TEXT,
+            rule_evaluation TEXT
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS expense_logs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id TEXT,
+            action TEXT,
+            amount REAL,
+            category TEXT,
+            timestamp DATETIME,
+            status TEXT,
+            rule_evaluation TEXT
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS leave_requests (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id TEXT,
+            action TEXT,
+            leave_type TEXT,
+            start_date DATE,
+            end_date DATE,
+            days INTEGER,
+            timestamp DATETIME,
+            status TEXT,
+            rule_evaluation TEXT
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS purchase_requests (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id TEXT,
+            action TEXT,
+            amount REAL,
+            vendor TEXT,
+            item TEXT,
+            quantity INTEGER,
+            timestamp DATETIME,
+            status TEXT,
+            rule_evaluation TEXT
+        )
+        '''
+    ]),
+    (2, [
+        'CREATE INDEX IF NOT EXISTS idx_attendance_logs_user_ts ON attendance_logs (user_id, timestamp DESC)',
+        'CREATE INDEX IF NOT EXISTS idx_attendance_logs_status_ts ON attendance_logs (status, timestamp)',
+        'CREATE INDEX IF NOT EXISTS idx_expense_logs_user_ts ON expense_logs (user_id, timestamp DESC)',
+        'CREATE INDEX IF NOT EXISTS idx_expense_logs_status_ts ON expense_logs (status, timestamp)',
+        'CREATE INDEX IF NOT EXISTS idx_leave_requests_user_ts ON leave_requests (user_id, timestamp DESC)',
+        'CREATE INDEX IF NOT EXISTS idx_leave_requests_status_ts ON leave_requests (status, timestamp)',
+        'CREATE INDEX IF NOT EXISTS idx_purchase_requests_user_ts ON purchase_requests (user_id, timestamp DESC)',
+        'CREATE INDEX IF NOT EXISTS idx_purchase_requests_status_ts ON purchase_requests (status, timestamp)'
+    ]),
+    (3, [
+        'CREATE INDEX IF NOT EXISTS idx_attendance_logs_ts ON attendance_logs (timestamp DESC)',
+        'CREATE INDEX IF NOT EXISTS idx_expense_logs_ts ON expense_logs (timestamp DESC)',
+        'CREATE INDEX IF NOT EXISTS idx_leave_requests_ts ON leave_requests (timestamp DESC)',
+        'CREATE INDEX IF NOT EXISTS idx_purchase_requests_ts ON purchase_requests (timestamp DESC)'
+    ]),
+    (4, [
+        # One append-only event log for every feature; feature-specific fields live in payload
+        '''
+        CREATE TABLE action_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id TEXT,
+            feature TEXT,
+            action TEXT,
+            timestamp DATETIME,
+            status TEXT,
+            payload TEXT,
+            rule_evaluation TEXT
+        )
+        ''',
+        'CREATE INDEX idx_action_events_user_ts ON action_events (user_id, timestamp DESC)',
+        'CREATE INDEX idx_action_events_feature_user_ts ON action_events (feature, user_id, timestamp DESC)',
+        'CREATE INDEX idx_action_events_feature_ts ON action_events (feature, timestamp DESC)',
+        'CREATE INDEX idx_action_events_status_ts ON action_events (status, timestamp)',
+        'CREATE INDEX idx_action_events_ts ON action_events (timestamp DESC)',
+        '''
+        INSERT INTO action_events (user_id, feature, action, timestamp, status, payload, rule_evaluation)
+        SELECT user_id, feature, action, timestamp, status, payload, rule_evaluation FROM (
+            SELECT user_id, 'ATTENDANCE' AS feature, action, timestamp, status,
+                   json_object('location', location) AS payload, rule_evaluation FROM attendance_logs
+            UNION ALL
+            SELECT user_id, 'EXPENSE', action, timestamp, status,
+                   json_object('amount', amount, 'category', category), rule_evaluation FROM expense_logs
+            UNION ALL
+            SELECT user_id, 'LEAVE', action, timestamp, status,
+                   json_object('leave_type', leave_type, 'start_date', start_date, 'end_date', end_date, 'days', days),
+                   rule_evaluation FROM leave_requests
+            UNION ALL
+            SELECT user_id, 'PURCHASE', action, timestamp, status,
+                   json_object('amount', amount, 'vendor', vendor, 'item', item, 'quantity', quantity),
+                   rule_evaluation FROM purchase_requests
+        ) ORDER BY timestamp
+        ''',
+        'DROP TABLE attendance_logs',
+        'DROP TABLE expense_logs',
+        'DROP TABLE leave_requests',
+        'DROP TABLE purchase_requests',
+        # The old per-feature tables remain readable as views over the event log
+        '''
+        CREATE VIEW attendance_logs AS
+        SELECT id, user_id, action, timestamp, json_extract(payload, '$.location') AS location,
+               status, rule_evaluation
+        FROM action_events WHERE feature = 'ATTENDANCE'
+        ''',
+        '''
+        CREATE VIEW expense_logs AS
+        SELECT id, user_id, action, json_extract(payload, '$.amount') AS amount,
+               json_extract(payload, '$.category') AS category, timestamp, status, rule_evaluation
+        FROM action_events WHERE feature = 'EXPENSE'
+        ''',
+        '''
+        CREATE VIEW leave_requests AS
+        SELECT id, user_id, action, json_extract(payload, '$.leave_type') AS leave_type,
+               json_extract(payload, '$.start_date') AS start_date, json_extract(payload, '$.end_date') AS end_date,
+               json_extract(payload, '$.days') AS days, timestamp, status, rule_evaluation
+        FROM action_events WHERE feature = 'LEAVE'
+        ''',
+        '''
+        CREATE VIEW purchase_requests AS
+        SELECT id, user_id, action, json_extract(payload, '$.amount') AS amount,
+               json_extract(payload, '$.vendor') AS vendor, json_extract(payload, '$.item') AS item,
+               json_extract(payload, '$.quantity') AS quantity, timestamp, status, rule_evaluation
+        FROM action_events WHERE feature = 'PURCHASE'
+        '''
+    ]),
+    (5, [
+        # Decision-first evaluations: the explanation is generated later from the stored rules and request
+        '''
+        CREATE TABLE decision_explanations (
+            decision_id TEXT PRIMARY KEY,
+            created_at DATETIME,
+            feature TEXT,
+            action TEXT,
+            decision TEXT,
+            rule_id INTEGER,
+            model TEXT,
+            rules TEXT,
+            request TEXT,
+            explanation TEXT,
+            explained_at DATETIME
+        )
+        ''',
+        'ALTER TABLE action_events ADD COLUMN decision_id TEXT',
+        'CREATE INDEX idx_action_events_decision_id ON action_events (decision_id)'
+    ])
+]
+
+# Feature -> per-feature view kept for the pre-event-log tables
+FEATURE_VIEWS = {
+    'ATTENDANCE': 'attendance_logs',
+    'EXPENSE': 'expense_logs',
+    'LEAVE': 'leave_requests',
+    'PURCHASE': 'purchase_requests'
+}
+
+EVENT_COLUMNS = ['user_id', 'feature', 'action', 'timestamp', 'status', 'payload', 'rule_evaluation', 'decision_id']
+
+DECISION_COLUMNS = ['decision_id', 'created_at', 'feature', 'action', 'decision', 'rule_id', 'model', 'rules', 'request']
+
+# (FEATURE, ACTION or None) -> handler(executor, user, action, parameters, rule_evaluation) returning an event
+EXECUTOR_REGISTRY: Dict[tuple, Callable] = {}
+
+
+def register_executor(feature: str, action: Optional[str] = None):
+    """Register a record builder for a feature, or for one action of a feature"""
+    def decorator(handler: Callable) -> Callable:
+        EXECUTOR_REGISTRY[(feature, action)] = handler
+        return handler
+    return decorator
+
+
+def load_handler(path: str) -> Callable:
+    """Import a handler given as 'package.module:function' or 'package.module.function'"""
+    module_name, _, attribute = path.partition(':') if ':' in path else path.rpartition('.')
+    return getattr(importlib.import_module(module_name), attribute)
+
+
+def parse_history_cursor(before: Any) -> tuple:
+    """
+    Split a history cursor ("<timestamp>|<id>") into (timestamp, id); a bare timestamp
+    gives id None. Timestamps are normalized to the stored "YYYY-MM-DD HH:MM:SS" form,
+    so ISO values such as execution_result timestamps compare correctly.
+    """
+    if isinstance(before, datetime):
+        return str(before), None
+    timestamp, separator, row_id = str(before).strip().rpartition('|')
+    if not separator or not row_id.isdigit():
+        timestamp, row_id = str(before).strip(), None
+    return timestamp.replace('T', ' '), int(row_id) if row_id is not None else None
+
+
+class BufferedActionWriter:
+    """
+    Background writer that group-commits action records: inserts are queued and
+    flushed with executemany in one transaction every batch_size rows or
+    flush_interval_ms milliseconds, whichever comes first.
+    """
+    
+    def __init__(self, executor: 'ActionExecutor', batch_size: int = 500, flush_interval_ms: float = 20):
+        self.executor = executor
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000.0
+        self._queue = queue.Queue()
+        self._closed = False
+        # Makes the closed check and the enqueue atomic with respect to close()
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="action-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+    
+    def submit(self, record: Dict[str, Any]) -> Future:
+        """Queue a prepared record; the Future resolves to the execution result"""
+        future = Future()
+        with self._lock:
+            if not self._closed:
+                self._queue.put((record, future))
+                return future
+        future.set_result(self.executor.failure_result(record['action'], RuntimeError("writer is closed")))
+        return future
+    
+    def close(self):
+        """Flush everything queued so far and stop the writer thread"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(None)
+        self._thread.join()
+    
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+            stop = False
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            self._flush(batch)
+            if stop:
+                return
+    
+    def _flush(self, batch: List[tuple]):
+        """Write a batch; never raises, so the writer thread keeps running"""
+        try:
+            self._write_batch(batch)
+        except Exception as e:
+            # Every caller waiting on this batch gets an answer
+            for record, future in batch:
+                if not future.done():
+                    future.set_result(self.executor.failure_result(record['action'], e))
+    
+    def _write_batch(self, batch: List[tuple]):
+        conn = self.executor.get_connection()
+        # Group rows by table so each table gets one executemany call
+        by_statement: Dict[str, List[tuple]] = {}
+        for record, future in batch:
+            by_statement.setdefault(self.executor.insert_statement(record), []).append((record, future))
+        
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            assigned = []
+            for statement, items in by_statement.items():
+                conn.executemany(statement, [record['values'] for record, _ in items])
+                # Rows inserted by one executemany inside our write transaction get consecutive ids
+                last_id = conn.execute('SELECT last_insert_rowid()').fetchone()[0]
+                first_id = last_id - len(items) + 1
+                assigned.extend((record, future, first_id + offset) for offset, (record, future) in enumerate(items))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            # Retry one by one so a single bad row does not fail the whole batch
+            for record, future in batch:
+                try:
+                    with conn:
+                        cursor = conn.execute(self.executor.insert_statement(record), record['values'])
+                    future.set_result(self.executor.success_result(record, cursor.lastrowid))
+                except Exception as e:
+                    future.set_result(self.executor.failure_result(record['action'], e))
+            return
+        
+        for record, future, action_id in assigned:
+            future.set_result(self.executor.success_result(record, action_id))
+
 class ActionExecutor:
     """
     Executes actions when allowed by the agentic rule engine.
     This demonstrates how actions can be performed automatically after LLM approval.
     """
     
-    def __init__(self, db_file='actions.db'):
+    def __init__(self, db_file='actions.db', cache_size_kb: int = 8192, cached_statements: int = 256,
+                 buffered: bool = False, batch_size: int = 500, flush_interval_ms: float = 20,
+                 feature_definitions: Optional[Dict[str, Any]] = None):
         self.db_file = db_file
+        self.feature_definitions = feature_definitions or {}
+        # (feature, action) -> resolved handler, filled on first use
+        self._dispatch: Dict[tuple, Callable] = {}
+        self.cache_size_kb = cache_size_kb
+        self.cached_statements = cached_statements
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
         self.init_database()
+        self.writer = BufferedActionWriter(self, batch_size, flush_interval_ms) if buffered else None
+    
+    def get_connection(self) -> sqlite3.Connection:
+        """
+        Return this thread's long-lived connection, opening and tuning it on first use.
+        sqlite3 keeps a per-connection statement cache, so repeated INSERT/SELECT
+        statements are prepared once per thread.
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            return conn
+        
+        conn = sqlite3.connect(self.db_file, timeout=30, check_same_thread=False,
+                               cached_statements=self.cached_statements)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f'PRAGMA cache_size=-{int(self.cache_size_kb)}')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        
+        self._local.conn = conn
+        with self._connections_lock:
+            # Close connections left behind by threads that have exited (e.g. Streamlit reruns)
+            stale = [(thread, other) for thread, other in self._connections if not thread.is_alive()]
+            self._connections = [(thread, other) for thread, other in self._connections if thread.is_alive()]
+            self._connections.append((threading.current_thread(), conn))
+        for _, other in stale:
+            try:
+                other.close()
+            except sqlite3.Error:
+                pass
+        return conn
+    
+    def close(self):
+        """Flush pending buffered writes and close every connection opened by this executor"""
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for _, conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        self._local = threading.local()
     
     def init_database(self):
-        """Initialize SQLite database for action logging"""
-        conn = sqlite3.connect(self.db_file)
-        cursor = conn.cursor()
+        """Initialize SQLite database for action logging and apply pending schema migrations"""
+        conn = self.get_connection()
+        
+        with conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS schema_version (
+                    version INTEGER PRIMARY KEY,
+                    applied_at DATETIME
+                )
+            ''')
+        
+        for version, statements in SCHEMA_MIGRATIONS:
+            if version <= self.get_schema_version():
+                continue
+            # Take the write lock before re-checking so concurrent processes apply each migration once
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                if version > self.get_schema_version():
+                    for statement in statements:
+                        conn.execute(statement)
+                    conn.execute('INSERT INTO schema_version (version, applied_at) VALUES (?, ?)',
+                                 (version, datetime.now()))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+    
+    def get_schema_version(self) -> int:
+        """Return the latest applied schema migration"""
+        conn = self.get_connection()
+        return conn.execute('SELECT COALESCE(MAX(version), 0) FROM schema_version').fetchone()[0]
+    
+    @register_executor('ATTENDANCE')
+    def prepare_attendance_record(self, user: str, action: str, parameters: Dict[str, Any],
+                                  rule_evaluation: Dict[str, Any]) -> Dict[str, Any]:
+        """Build the event for an attendance action"""
+        location = parameters.get('LOCATION', 'Unknown')
         
-        # Create tables for different features
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS attendance_logs (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id TEXT,
-                action TEXT,
-                timestamp DATETIME,
-                location TEXT,
-                status TEXT,
-                rule_evaluation TEXT
-            )
-        ''')
+        return self.build_event(user, 'ATTENDANCE', action, {"location": location}, rule_evaluation,
+                                f"✅ {action} executed successfully for {user}")
+    
+    @register_executor('EXPENSE')
+    def prepare_expense_record(self, user: str, action: str, parameters: Dict[str, Any],
+                               rule_evaluation: Dict[str, Any]) -> Dict[str, Any]:
+        """Build the event for an expense action"""
+        amount = parameters.get('AMOUNT', 0.0)
+        category = parameters.get('CATEGORY', 'General')
         
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS expense_logs (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id TEXT,
-                action TEXT,
-                amount REAL,
-                category TEXT,
-                timestamp DATETIME,
-                status TEXT,
-                rule_evaluation TEXT
-            )
-        ''')
+        return self.build_event(user, 'EXPENSE', action, {"amount": amount, "category": category}, rule_evaluation,
+                                f"✅ {action} executed successfully for {user} - Amount: ${amount}")
+    
+    @register_executor('LEAVE')
+    def prepare_leave_record(self, user: str, action: str, parameters: Dict[str, Any],
+                             rule_evaluation: Dict[str, Any]) -> Dict[str, Any]:
+        """Build the event for a leave action"""
+        leave_type = parameters.get('TYPE', 'Annual')
+        start_date = parameters.get('START_DATE', datetime.now().date())
+        end_date = parameters.get('END_DATE', datetime.now().date())
+        days = parameters.get('AMOUNT', 1)
         
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS leave_requests (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id TEXT,
-                action TEXT,
-                leave_type TEXT,
-                start_date DATE,
-                end_date DATE,
-                days INTEGER,
-                timestamp DATETIME,
-                status TEXT,
-                rule_evaluation TEXT
-            )
-        ''')
+        payload = {"leave_type": leave_type, "start_date": start_date, "end_date": end_date, "days": days}
+        return self.build_event(user, 'LEAVE', action, payload, rule_evaluation,
+                                f"✅ {action} executed successfully for {user} - {days} days {leave_type} leave")
+    
+    @register_executor('PURCHASE')
+    def prepare_purchase_record(self, user: str, action: str, parameters: Dict[str, Any],
+                                rule_evaluation: Dict[str, Any]) -> Dict[str, Any]:
+        """Build the event for a purchase action"""
+        amount = parameters.get('AMOUNT', 0.0)
+        vendor = parameters.get('VENDOR', 'Unknown')
+        item = parameters.get('ITEM', 'Unknown')
+        quantity = parameters.get('QUANTITY', 1)
         
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS purchase_requests (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id TEXT,
-                action TEXT,
-                amount REAL,
-                vendor TEXT,
-                item TEXT,
-                quantity INTEGER,
-                timestamp DATETIME,
-                status TEXT,
-                rule_evaluation TEXT
-            )
-        ''')
+        payload = {"amount": amount, "vendor": vendor, "item": item, "quantity": quantity}
+        return self.build_event(user, 'PURCHASE', action, payload, rule_evaluation,
+                                f"✅ {action} executed successfully for {user} - {quantity}x {item} from {vendor}")
+    
+    def prepare_generic_record(self, feature: str, user: str, action: str, parameters: Dict[str, Any],
+                               rule_evaluation: Dict[str, Any]) -> Dict[str, Any]:
+        """Build the event for a feature without a dedicated executor; parameters are stored as-is"""
+        payload = {name.lower(): value for name, value in parameters.items()}
+        return self.build_event(user, feature, action, payload, rule_evaluation,
+                                f"✅ {action} executed successfully for {user}")
+    
+    def build_event(self, user: str, feature: str, action: str, payload: Dict[str, Any],
+                    rule_evaluation: Dict[str, Any], message: str) -> Dict[str, Any]:
+        """Build the action_events row shared by all features"""
+        timestamp = datetime.now()
         
-        conn.commit()
-        conn.close()
+        return {
+            "table": "action_events",
+            "columns": EVENT_COLUMNS,
+            "values": (user, feature, action, timestamp, rule_evaluation['decision'],
+                       json.dumps(payload, separators=(',', ':'), default=str), json.dumps(rule_evaluation),
+                       rule_evaluation.get('decision_id')),
+            "timestamp": timestamp,
+            "action": action,
+            "message": message
+        }
     
     def execute_attendance_action(self, user: str, action: str, parameters: Dict[str, Any], 
                                 rule_evaluation: Dict[str, Any]) -> Dict[str, Any]:
         """Execute attendance-related actions"""
-        try:
-            conn = sqlite3.connect(self.db_file)
-            cursor = conn.cursor()
-            
-            timestamp = datetime.now()
-            location = parameters.get('LOCATION', 'Unknown')
-            
-            cursor.execute('''
-                INSERT INTO attendance_logs (user_id, action, timestamp, location, status, rule_evaluation)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (user, action, timestamp, location, rule_evaluation['decision'], 
-                  json.dumps(rule_evaluation)))
-            
-            conn.commit()
-            conn.close()
-            
-            return {
-                "success": True,
-                "message": f"✅ {action} executed successfully for {user}",
-                "timestamp": timestamp,
-                "action_id": cursor.lastrowid
-            }
-            
-        except Exception as e:
-            return {
-                "success": False,
-                "message": f"❌ Failed to execute {action}: {str(e)}"
-            }
+        return self.write_record(self.prepare_attendance_record, user, action, parameters, rule_evaluation)
     
     def execute_expense_action(self, user: str, action: str, parameters: Dict[str, Any], 
                              rule_evaluation: Dict[str, Any]) -> Dict[str, Any]:
         """Execute expense-related actions"""
-        try:
-            conn = sqlite3.connect(self.db_file)
-            cursor = conn.cursor()
-            
-            timestamp = datetime.now()
-            amount = parameters.get('AMOUNT', 0.0)
-            category = parameters.get('CATEGORY', 'General')
-            
-            cursor.execute('''
-                INSERT INTO expense_logs (user_id, action, amount, category, timestamp, status, rule_evaluation)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            ''', (user, action, amount, category, timestamp, rule_evaluation['decision'], 
-                  json.dumps(rule_evaluation)))
-            
-            conn.commit()
-            conn.close()
-            
-            return {
-                "success": True,
-                "message": f"✅ {action} executed successfully for {user} - Amount: ${amount}",
-                "timestamp": timestamp,
-                "action_id": cursor.lastrowid
-            }
-            
-        except Exception as e:
-            return {
-                "success": False,
-                "message": f"❌ Failed to execute {action}: {str(e)}"
-            }
+        return self.write_record(self.prepare_expense_record, user, action, parameters, rule_evaluation)
     
     def execute_leave_action(self, user: str, action: str, parameters: Dict[str, Any], 
                            rule_evaluation: Dict[str, Any]) -> Dict[str, Any]:
         """Execute leave-related actions"""
-        try:
-            conn = sqlite3.connect(self.db_file)
-            cursor = conn.cursor()
-            
-            timestamp = datetime.now()
-            leave_type = parameters.get('TYPE', 'Annual')
-            start_date = parameters.get('START_DATE', datetime.now().date())
-            end_date = parameters.get('END_DATE', datetime.now().date())
-            days = parameters.get('AMOUNT', 1)
-            
-            cursor.execute('''
-                INSERT INTO leave_requests (user_id, action, leave_type, start_date, end_date, days, timestamp, status, rule_evaluation)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (user, action, leave_type, start_date, end_date, days, timestamp, 
-                  rule_evaluation['decision'], json.dumps(rule_evaluation)))
-            
-            conn.commit()
-            conn.close()
-            
-            return {
-                "success": True,
-                "message": f"✅ {action} executed successfully for {user} - {days} days {leave_type} leave",
-                "timestamp": timestamp,
-                "action_id": cursor.lastrowid
-            }
-            
-        except Exception as e:
-            return {
-                "success": False,
-                "message": f"❌ Failed to execute {action}: {str(e)}"
-            }
+        return self.write_record(self.prepare_leave_record, user, action, parameters, rule_evaluation)
     
     def execute_purchase_action(self, user: str, action: str, parameters: Dict[str, Any], 
                               rule_evaluation: Dict[str, Any]) -> Dict[str, Any]:
         """Execute purchase-related actions"""
+        return self.write_record(self.prepare_purchase_record, user, action, parameters, rule_evaluation)
+    
+    def write_record(self, prepare, user: str, action: str, parameters: Dict[str, Any],
+                     rule_evaluation: Dict[str, Any]) -> Dict[str, Any]:
+        """Prepare and persist one action record, waiting for the result"""
+        return self.submit_record(prepare, user, action, parameters, rule_evaluation).result()
+    
+    def submit_record(self, prepare, user: str, action: str, parameters: Dict[str, Any],
+                      rule_evaluation: Dict[str, Any]) -> Future:
+        """Prepare one action record and hand it to the buffered writer, or insert it directly"""
+        future = Future()
         try:
-            conn = sqlite3.connect(self.db_file)
-            cursor = conn.cursor()
-            
-            timestamp = datetime.now()
-            amount = parameters.get('AMOUNT', 0.0)
-            vendor = parameters.get('VENDOR', 'Unknown')
-            item = parameters.get('ITEM', 'Unknown')
-            quantity = parameters.get('QUANTITY', 1)
-            
-            cursor.execute('''
-                INSERT INTO purchase_requests (user_id, action, amount, vendor, item, quantity, timestamp, status, rule_evaluation)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (user, action, amount, vendor, item, quantity, timestamp, 
-                  rule_evaluation['decision'], json.dumps(rule_evaluation)))
-            
-            conn.commit()
-            conn.close()
-            
-            return {
-                "success": True,
-                "message": f"✅ {action} executed successfully for {user} - {quantity}x {item} from {vendor}",
-                "timestamp": timestamp,
-                "action_id": cursor.lastrowid
-            }
-            
+            record = prepare(user, action, parameters, rule_evaluation)
         except Exception as e:
-            return {
-                "success": False,
-                "message": f"❌ Failed to execute {action}: {str(e)}"
-            }
+            future.set_result(self.failure_result(action, e))
+            return future
+        return self.submit_prepared(record)
+    
+    def submit_prepared(self, record: Dict[str, Any]) -> Future:
+        """Hand a prepared record to the buffered writer, or insert it directly"""
+        if self.writer is not None:
+            return self.writer.submit(record)
+        
+        future = Future()
+        try:
+            conn = self.get_connection()
+            with conn:
+                cursor = conn.execute(self.insert_statement(record), record['values'])
+            future.set_result(self.success_result(record, cursor.lastrowid))
+        except Exception as e:
+            future.set_result(self.failure_result(record['action'], e))
+        return future
+    
+    def record_decision(self, decision_id: str, feature: str, action: str, decision: Dict[str, Any],
+                        rules: List[str], request: str) -> Future:
+        """
+        Store a decision-first evaluation with the rules and request it was made on,
+        so its explanation can be generated later (see get_decision/save_explanation).
+        """
+        timestamp = datetime.now()
+        return self.submit_prepared({
+            "table": "decision_explanations",
+            "columns": DECISION_COLUMNS,
+            "values": (decision_id, timestamp, feature, action, decision['decision'], decision.get('rule_id'),
+                       decision.get('model'), json.dumps(rules), request),
+            "timestamp": timestamp,
+            "action": action,
+            "message": f"✅ Decision {decision_id} recorded"
+        })
+    
+    def get_decision(self, decision_id: str) -> Optional[Dict[str, Any]]:
+        """A recorded decision with its rules, request and explanation (None until generated)"""
+        conn = self.get_connection()
+        row = conn.execute(
+            f"SELECT {', '.join(DECISION_COLUMNS)}, explanation, explained_at FROM decision_explanations "
+            "WHERE decision_id = ?", (decision_id,)).fetchone()
+        if row is None:
+            return None
+        decision = dict(zip(DECISION_COLUMNS + ['explanation', 'explained_at'], row))
+        decision['rules'] = json.loads(decision['rules'])
+        return decision
+    
+    def save_explanation(self, decision_id: str, explanation: str):
+        """Store the generated explanation of a recorded decision"""
+        conn = self.get_connection()
+        with conn:
+            conn.execute("UPDATE decision_explanations SET explanation = ?, explained_at = ? WHERE decision_id = ?",
+                         (explanation, datetime.now(), decision_id))
+    
+    def insert_statement(self, record: Dict[str, Any]) -> str:
+        """INSERT statement for a prepared record"""
+        placeholders = ', '.join('?' for _ in record['columns'])
+        return f"INSERT INTO {record['table']} ({', '.join(record['columns'])}) VALUES ({placeholders})"
+    
+    def success_result(self, record: Dict[str, Any], action_id: int) -> Dict[str, Any]:
+        return {
+            "success": True,
+            "message": record['message'],
+            "timestamp": record['timestamp'],
+            "action_id": action_id
+        }
+    
+    def failure_result(self, action: str, error: Exception) -> Dict[str, Any]:
+        return {
+            "success": False,
+            "message": f"❌ Failed to execute {action}: {str(error)}"
+        }
     
     def execute_action(self, user: str, feature: str, action: str, parameters: Dict[str, Any], 
                       rule_evaluation: Dict[str, Any]) -> Dict[str, Any]:
         """Main action execution method"""
+        return self.submit_action(user, feature, action, parameters, rule_evaluation).result()
+    
+    def submit_action(self, user: str, feature: str, action: str, parameters: Dict[str, Any],
+                      rule_evaluation: Dict[str, Any], callback=None) -> Future:
+        """
+        Queue an action for execution and return a Future for its result.
         
+        With a buffered writer the insert is group-committed with other pending
+        actions; callback, if given, is called with the result dict when it is known.
+        """
+        future = self.route_action(user, feature, action, parameters, rule_evaluation)
+        if callback is not None:
+            future.add_done_callback(lambda done: callback(done.result()))
+        return future
+    
+    def route_action(self, user: str, feature: str, action: str, parameters: Dict[str, Any],
+                     rule_evaluation: Dict[str, Any]) -> Future:
+        """Route an action to the record builder for its feature"""
         if rule_evaluation['decision'] != 'ALLOWED':
-            return {
+            return self.completed({
                 "success": False,
                 "message": f"❌ Action not executed - Rule evaluation: {rule_evaluation['decision']}"
-            }
+            })
         
-        # Route to appropriate executor based on feature
-        if feature == 'ATTENDANCE':
-            return self.execute_attendance_action(user, action, parameters, rule_evaluation)
-        elif feature == 'EXPENSE':
-            return self.execute_expense_action(user, action, parameters, rule_evaluation)
-        elif feature == 'LEAVE':
-            return self.execute_leave_action(user, action, parameters, rule_evaluation)
-        elif feature == 'PURCHASE':
-            return self.execute_purchase_action(user, action, parameters, rule_evaluation)
-        else:
-            return {
+        try:
+            handler = self.resolve_handler(feature, action)
+        except Exception as e:
+            return self.completed({
                 "success": False,
-                "message": f"❌ No executor found for feature: {feature}"
-            }
+                "message": f"❌ No executor found for feature: {feature} ({str(e)})"
+            })
+        
+        return self.submit_record(handler, user, action, parameters, rule_evaluation)
+    
+    def set_feature_definitions(self, feature_definitions: Dict[str, Any]):
+        """Replace the feature definitions that may name executors, dropping resolved handlers"""
+        self.feature_definitions = feature_definitions or {}
+        self._dispatch = {}
+    
+    def resolve_handler(self, feature: str, action: str) -> Callable:
+        """
+        Find the record builder for a feature action. Action-specific handlers win over
+        feature-wide ones, and at each level an import path from feature_definitions
+        ('action_executors' / 'executor') wins over a registered handler; features with
+        neither use the generic event builder. Resolved handlers are memoized.
+        """
+        key = (feature, action)
+        handler = self._dispatch.get(key)
+        if handler is not None:
+            return handler
+        
+        definition = self.feature_definitions.get(feature, {})
+        if action in definition.get('action_executors', {}):
+            handler = partial(load_handler(definition['action_executors'][action]), self)
+        elif (feature, action) in EXECUTOR_REGISTRY:
+            handler = partial(EXECUTOR_REGISTRY[(feature, action)], self)
+        elif definition.get('executor'):
+            handler = partial(load_handler(definition['executor']), self)
+        elif (feature, None) in EXECUTOR_REGISTRY:
+            handler = partial(EXECUTOR_REGISTRY[(feature, None)], self)
+        else:
+            # Any other feature is recorded with its raw parameters
+            handler = partial(self.prepare_generic_record, feature)
+        
+        self._dispatch[key] = handler
+        return handler
+    
+    def completed(self, result: Dict[str, Any]) -> Future:
+        future = Future()
+        future.set_result(result)
+        return future
     
     def get_action_history(self, user: Optional[str] = None, feature: Optional[str] = None, 
-                          limit: int = 50) -> List[Dict[str, Any]]:
-        """Get action history from database"""
+                          limit: int = 50, before: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Get action history from database, newest first (ties broken by id).
+        
+        Pass the `cursor` of the last record of a page as `before` to get the next page.
+        A plain timestamp is also accepted; rows sharing exactly that timestamp are then
+        skipped, so prefer the cursor.
+        """
         try:
-            conn = sqlite3.connect(self.db_file)
+            conn = self.get_connection()
             cursor = conn.cursor()
             
-            # Determine which table to query based on feature
-            if feature == 'ATTENDANCE':
-                table = 'attendance_logs'
-                columns = ['user_id', 'action', 'timestamp', 'location', 'status']
-            elif feature == 'EXPENSE':
-                table = 'expense_logs'
-                columns = ['user_id', 'action', 'amount', 'category', 'timestamp', 'status']
-            elif feature == 'LEAVE':
-                table = 'leave_requests'
-                columns = ['user_id', 'action', 'leave_type', 'days', 'timestamp', 'status']
-            elif feature == 'PURCHASE':
-                table = 'purchase_requests'
-                columns = ['user_id', 'action', 'amount', 'vendor', 'item', 'timestamp', 'status']
-            else:
-                # Get from all tables
-                return self.get_all_action_history(user, limit)
-            
-            # Build query
-            query = f"SELECT {', '.join(columns)} FROM {table}"
+            query = "SELECT id, user_id, feature, action, timestamp, status, payload, decision_id FROM action_events"
+            conditions = []
             params = []
             
+            if feature:
+                conditions.append("feature = ?")
+                params.append(feature)
+            
             if user:
-                query += " WHERE user_id = ?"
+                conditions.append("user_id = ?")
                 params.append(user)
             
-            query += " ORDER BY timestamp DESC LIMIT ?"
+            if before:
+                before_timestamp, before_id = parse_history_cursor(before)
+                if before_id is None:
+                    conditions.append("timestamp < ?")
+                    params.append(before_timestamp)
+                else:
+                    conditions.append("(timestamp < ? OR (timestamp = ? AND id < ?))")
+                    params.extend([before_timestamp, before_timestamp, before_id])
+            
+            if conditions:
+                query += " WHERE " + " AND ".join(conditions)
+            
+            query += " ORDER BY timestamp DESC, id DESC LIMIT ?"
             params.append(limit)
             
             cursor.execute(query, params)
             rows = cursor.fetchall()
             
-            # Convert to list of dictionaries
+            # Convert to list of dictionaries, flattening the payload fields
             history = []
-            for row in rows:
-                history.append(dict(zip(columns, row)))
+            for row_id, user_id, row_feature, action, timestamp, status, payload, decision_id in rows:
+                record = {
+                    "id": row_id,
+                    "cursor": f"{timestamp}|{row_id}",
+                    "user_id": user_id,
+                    "feature": row_feature,
+                    "action": action,
+                    "timestamp": timestamp,
+                    "status": status,
+                    "table": FEATURE_VIEWS.get(row_feature, "action_events")
+                }
+                if decision_id:
+                    record["decision_id"] = decision_id
+                if payload:
+                    for key, value in json.loads(payload).items():
+                        record.setdefault(key, value)
+                history.append(record)
             
-            conn.close()
             return history
             
         except Exception as e:
             return [{"error": f"Failed to get history: {str(e)}"}]
     
-    def get_all_action_history(self, user: Optional[str] = None, limit: int = 50) -> List[Dict[str, Any]]:
-        """Get action history from all tables"""
-        try:
-            conn = sqlite3.connect(self.db_file)
-            cursor = conn.cursor()
-            
-            all_history = []
-            
-            # Get from each table
-            tables = [
-                ('attendance_logs', ['user_id', 'action', 'timestamp', 'location', 'status']),
-                ('expense_logs', ['user_id', 'action', 'amount', 'category', 'timestamp', 'status']),
-                ('leave_requests', ['user_id', 'action', 'leave_type', 'days', 'timestamp', 'status']),
-                ('purchase_requests', ['user_id', 'action', 'amount', 'vendor', 'item', 'timestamp', 'status'])
-            ]
-            
-            for table, columns in tables:
-                query = f"SELECT {', '.join(columns)} FROM {table}"
-                params = []
-                
-                if user:
-                    query += " WHERE user_id = ?"
-                    params.append(user)
-                
-                query += " ORDER BY timestamp DESC LIMIT ?"
-                params.append(limit // len(tables))  # Distribute limit across tables
-                
-                cursor.execute(query, params)
-                rows = cursor.fetchall()
-                
-                for row in rows:
-                    record = dict(zip(columns, row))
-                    record['table'] = table  # Add table identifier
-                    all_history.append(record)
-            
-            # Sort by timestamp and limit
-            all_history.sort(key=lambda x: x.get('timestamp', ''), reverse=True)
-            conn.close()
-            
-            return all_history[:limit]
-            
-        except Exception as e:
-            return [{"error": f"Failed to get history: {str(e)}"}]
+    def get_all_action_history(self, user: Optional[str] = None, limit: int = 50,
+                               before: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Get the global newest `limit` actions across all features"""
+        return self.get_action_history(user=user, limit=limit, before=before)
 
 def action_history_interface():
     """Interface for viewing action history"""
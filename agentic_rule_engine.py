@@ -1,16 +1,127 @@
 import streamlit as st
 import json
+import asyncio
+import threading
 from datetime import datetime
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 import os
 from dotenv import load_dotenv
 import re
-from typing import Dict, List, Any, Optional
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Any, Optional, Iterator
 from action_executor import ActionExecutor
+from decision_cache import DecisionCache, decision_key, rule_set_digest
+from llm_transport import LLMTransport
+from rule_index import RuleSetIndex
+from rule_snapshot import RuleSnapshot, RulesFileWatcher
+from rule_store import open_rule_store, empty_rules_data, apply_assignments, iter_assignments, Assignments
+from single_flight import SingleFlight, AsyncSingleFlight
+from stream_parser import EvaluationStreamParser
 
 # Load environment variables
 load_dotenv()
-client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+
+# Default OpenAI clients, created on first use so importing this module needs no API key
+_client: Optional[OpenAI] = None
+_async_client: Optional[AsyncOpenAI] = None
+
+def get_client() -> OpenAI:
+    """Shared OpenAI client (OPENAI_BASE_URL is honoured, e.g. for a local stub)"""
+    global _client
+    if _client is None:
+        # Retries are done by the engine's LLMTransport
+        _client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'), max_retries=0)
+    return _client
+
+def get_async_client() -> AsyncOpenAI:
+    """Shared AsyncOpenAI client"""
+    global _async_client
+    if _async_client is None:
+        _async_client = AsyncOpenAI(api_key=os.getenv('OPENAI_API_KEY'), max_retries=0)
+    return _async_client
+
+EVALUATOR_MODEL = "gpt-4o"
+# Answers first; its decision is kept when it is confident enough, otherwise EVALUATOR_MODEL decides
+FAST_EVALUATOR_MODEL = "gpt-4o-mini"
+ESCALATION_CONFIDENCE = 0.8
+EVALUATOR_SYSTEM_PROMPT = "You are an expert rule evaluator for agentic applications. Be precise and follow the response format exactly."
+TEXT_MAX_TOKENS = 300
+STRUCTURED_MAX_TOKENS = 150
+# Decision-first mode: the first call returns only the decision and the deciding rule's number
+DECISION_MAX_TOKENS = 40
+BATCH_SIZE = 20
+BATCH_TOKENS_PER_ITEM = 120
+BATCH_DECISION_TOKENS_PER_ITEM = 24
+# Batched prompts are line-based; this line is added when a fast model answers first, so unsure answers escalate
+BATCH_CONFIDENCE_LINE = "Confidence: [Your confidence in the decision, from 0.0 to 1.0]"
+
+TEXT_RESPONSE_FORMAT = """Decision: [ALLOWED/DENIED]
+        Reason: [Brief explanation of which rule(s) were evaluated and why the decision was made]
+        Rule Violated: [If denied, specify which rule was violated]"""
+
+STRUCTURED_RESPONSE_FORMAT = """Respond with a JSON object with these fields:
+        decision: "ALLOWED" or "DENIED"
+        confidence_score: your confidence in the decision, from 0.0 to 1.0
+        reason: brief explanation of which rule(s) were evaluated and why the decision was made
+        rule_violated: the rule that was violated if denied, otherwise null"""
+
+DECISION_TEXT_RESPONSE_FORMAT = """Decision: [ALLOWED/DENIED]
+        Rule: [Number of the rule that decided the request, or None]"""
+
+DECISION_STRUCTURED_RESPONSE_FORMAT = """Respond with a JSON object with these fields:
+        decision: "ALLOWED" or "DENIED"
+        confidence_score: your confidence in the decision, from 0.0 to 1.0
+        rule_number: number of the rule that decided the request, or null"""
+
+# Structured response schema (whitepaper section 4.4); execution_result is added by the engine.
+# Fields are generated in this order, so a streamed response yields decision and confidence first.
+EVALUATION_RESPONSE_SCHEMA = {
+    "name": "rule_evaluation",
+    "strict": True,
+    "schema": {
+        "type": "object",
+        "properties": {
+            "decision": {"type": "string", "enum": ["ALLOWED", "DENIED"]},
+            "confidence_score": {"type": "number"},
+            "reason": {"type": "string"},
+            "rule_violated": {"type": ["string", "null"]}
+        },
+        "required": ["decision", "confidence_score", "reason", "rule_violated"],
+        "additionalProperties": False
+    }
+}
+
+DECISION_RESPONSE_SCHEMA = {
+    "name": "rule_decision",
+    "strict": True,
+    "schema": {
+        "type": "object",
+        "properties": {
+            "decision": {"type": "string", "enum": ["ALLOWED", "DENIED"]},
+            "confidence_score": {"type": "number"},
+            "rule_number": {"type": ["integer", "null"]}
+        },
+        "required": ["decision", "confidence_score", "rule_number"],
+        "additionalProperties": False
+    }
+}
+
+# Lines of a text decision-first answer and the result fields they fill
+DECISION_LINE_FIELDS = {"Decision": "decision", "Rule": "rule_number", "Confidence": "confidence_score"}
+
+EXPLANATION_PROMPT = """
+        You are an intelligent rule evaluator for an agentic application system.
+        
+        **APPLICABLE RULES:**
+        {rules}
+        
+        **REQUEST:**{request}
+        **DECISION:** {decision}
+        **DECIDING RULE:** {rule}
+        
+        In two or three sentences, explain which rule(s) were evaluated and why the request was {decision}.
+        Respond with the explanation only."""
 
 class AgenticRuleEngine:
     """
@@ -18,50 +129,146 @@ class AgenticRuleEngine:
     Uses standardized format with [FEATURE] and [PARAMETER] identification.
     """
     
-    def __init__(self, rules_file='agentic_rules.json'):
+    def __init__(self, rules_file='agentic_rules.json', decision_cache: Optional[DecisionCache] = None,
+                 max_concurrency: int = 64, llm_timeout: Optional[float] = 30.0,
+                 structured_output: bool = False, max_tokens: Optional[int] = None,
+                 rule_store=None, client: Optional[OpenAI] = None, async_client: Optional[AsyncOpenAI] = None,
+                 action_executor: Optional[ActionExecutor] = None,
+                 fast_model: Optional[str] = FAST_EVALUATOR_MODEL, strong_model: str = EVALUATOR_MODEL,
+                 escalation_confidence: float = ESCALATION_CONFIDENCE, streaming: bool = False,
+                 decision_first: bool = False, explain_in_background: bool = False,
+                 transport: Optional[LLMTransport] = None):
         self.rules_file = rules_file
+        # JSON file by default; pass a SQLiteRuleStore (or a .db path) for per-row updates
+        self.rule_store = rule_store if rule_store is not None else open_rule_store(rules_file)
+        # Tiered evaluation escalates on the fast model's confidence score, which needs structured output
+        self.fast_model = fast_model or None
+        self.strong_model = strong_model
+        self.escalation_confidence = escalation_confidence
+        # Stream completions and act on the decision before the reason is complete
+        self.streaming = streaming
+        # Ask for the decision and rule number only; reasons come later from get_explanation
+        self.decision_first = decision_first
+        self.explainer = ThreadPoolExecutor(max_workers=4, thread_name_prefix="explainer") if explain_in_background else None
+        structured_output = structured_output or self.fast_model is not None
+        self.structured_output = structured_output
+        if max_tokens is None:
+            if decision_first:
+                max_tokens = DECISION_MAX_TOKENS
+            else:
+                max_tokens = STRUCTURED_MAX_TOKENS if structured_output else TEXT_MAX_TOKENS
+        self.max_tokens = max_tokens
+        self.decision_cache = decision_cache if decision_cache is not None else DecisionCache()
+        self.max_concurrency = max_concurrency
+        self.llm_timeout = llm_timeout
+        self._async_semaphore = None
+        self._async_semaphore_loop = None
+        self.single_flight = SingleFlight()
+        self._reload_lock = threading.Lock()
+        self.async_single_flight = AsyncSingleFlight()
+        # Injected clients (e.g. pointed at a stub server) take precedence over the shared ones
+        self._client = client
+        self._async_client = async_client
+        # Retries, circuit breaker and optional hedging around every LLM call
+        self.transport = transport if transport is not None else LLMTransport()
+        self.action_executor = action_executor if action_executor is not None else ActionExecutor()
+        self.snapshot: Optional[RuleSnapshot] = None
+        self.watcher: Optional[RulesFileWatcher] = None
         self.load_rules()
-        self.features = self.extract_features()
-        self.parameters = self.extract_parameters()
-        self.action_executor = ActionExecutor()
+    
+    @property
+    def client(self) -> OpenAI:
+        if self._client is None:
+            self._client = get_client()
+        return self._client
+    
+    @property
+    def async_client(self) -> AsyncOpenAI:
+        if self._async_client is None:
+            self._async_client = get_async_client()
+        return self._async_client
+    
+    @property
+    def data(self) -> Dict[str, Any]:
+        """Rules document of the current snapshot"""
+        return self.snapshot.data
+    
+    @data.setter
+    def data(self, data: Dict[str, Any]):
+        self.publish_rules(data)
     
     def load_rules(self):
-        """Load rules from JSON file"""
-        try:
-            with open(self.rules_file, 'r') as file:
-                self.data = json.load(file)
-        except FileNotFoundError:
-            self.data = {
-                "rule_sets": {},
-                "user_assignments": {},
-                "global_parameters": {},
-                "feature_definitions": {}
-            }
+        """Load rules from the rule store"""
+        data = self.rule_store.load()
+        self.data = data if data is not None else empty_rules_data()
     
     def save_rules(self):
-        """Save rules to JSON file"""
-        with open(self.rules_file, 'w') as file:
-            json.dump(self.data, file, indent=4)
+        """Write the whole rules document to the rule store"""
+        self.rule_store.save(self.data)
+        self.refresh_rule_index()
+    
+    def reload_if_changed(self) -> bool:
+        """
+        Reload rules if the rule store was changed by someone else.
+        Returns True if rules were reloaded.
+        """
+        if not self.rule_store.has_changed():
+            return False
+        
+        with self._reload_lock:
+            if not self.rule_store.has_changed():
+                return False
+            try:
+                data = self.rule_store.load()
+            except json.JSONDecodeError:
+                # Probably caught mid-write; keep serving the current rules and retry on the next change
+                return False
+            if data is None:
+                return False
+            
+            self.data = data
+            return True
+    
+    def start_watching(self, interval: float = 1.0):
+        """Reload the rules in the background whenever the rule store changes"""
+        if self.watcher is None:
+            self.watcher = RulesFileWatcher(self.rule_store.watch_path, self.reload_if_changed, interval)
+            self.watcher.start()
+    
+    def stop_watching(self):
+        """Stop the background rules file watcher"""
+        if self.watcher is not None:
+            self.watcher.stop()
+            self.watcher = None
+    
+    def publish_rules(self, data: Dict[str, Any]):
+        """
+        Precompile a rules document and swap it in as the current snapshot.
+        
+        Evaluations already running keep the snapshot they started with. Cached
+        decisions are dropped only for rule sets whose rule text changed.
+        """
+        previous = self.snapshot
+        snapshot = RuleSnapshot(data, previous)
+        self.snapshot = snapshot
+        if previous is None:
+            # First load: also drop persisted decisions left over from older rule text
+            self.decision_cache.retain_rule_sets(snapshot.rule_set_digests.values())
+        else:
+            self.decision_cache.invalidate_rule_sets(snapshot.stale_digests(previous))
+        self.action_executor.set_feature_definitions(data.get('feature_definitions', {}))
+    
+    def refresh_rule_index(self):
+        """Rebuild the current snapshot after the rules document was changed in place"""
+        self.publish_rules(self.data)
     
     def extract_features(self) -> List[str]:
-        """Extract all unique features from rules"""
-        features = set()
-        for rule_set in self.data['rule_sets'].values():
-            for rule in rule_set['rules']:
-                # Find all [FEATURE] patterns
-                feature_matches = re.findall(r'\[([A-Z_]+)\]', rule)
-                features.update(feature_matches)
-        return list(features)
+        """All features that rules are written for, from the snapshot's tag index"""
+        return self.snapshot.tag_index.feature_names()
     
     def extract_parameters(self) -> List[str]:
-        """Extract all unique parameters from rules"""
-        parameters = set()
-        for rule_set in self.data['rule_sets'].values():
-            for rule in rule_set['rules']:
-                # Find all [PARAMETER] patterns
-                param_matches = re.findall(r'\[([A-Z_]+)\]', rule)
-                parameters.update(param_matches)
-        return list(parameters)
+        """All parameters referenced by rules, from the snapshot's tag index"""
+        return self.snapshot.tag_index.parameter_names()
     
     def evaluate_feature_action(self, user: str, feature: str, action: str, 
                               parameters: Dict[str, Any], rule_set_id: Optional[str] = None, 
@@ -80,24 +287,25 @@ class AgenticRuleEngine:
         Returns:
             Dictionary with decision, reason, rule_violated, and execution result
         """
-        if rule_set_id is None:
-            rule_set_id = self.data['user_assignments'].get(user)
-        
-        if not rule_set_id or rule_set_id not in self.data['rule_sets']:
-            return {
-                "decision": "ERROR",
-                "reason": f"No rule set found for user {user}",
-                "rule_violated": None,
-                "execution_result": None
-            }
+        if self.streaming and not self.decision_first:
+            for event in self.stream_feature_action(user, feature, action, parameters, rule_set_id, execute_action):
+                if event['event'] == 'result':
+                    return event['result']
         
-        rule_set = self.data['rule_sets'][rule_set_id]
+        # The whole evaluation runs against the rules snapshot current at this point
+        snapshot = self.snapshot
+        resolved = self.resolve_rule_set(user, rule_set_id, snapshot)
+        if resolved is None:
+            return self.no_rule_set_result(user)
+        rule_set_id, rule_set = resolved
         
-        # Build context for LLM
-        context = self.build_evaluation_context(feature, action, parameters, rule_set)
+        evaluation_result, cache_key, digest = self.evaluate_locally(rule_set_id, rule_set, feature, action, parameters, snapshot)
         
-        # Evaluate with LLM
-        evaluation_result = self.evaluate_with_llm(context)
+        if evaluation_result is None:
+            # Concurrent identical requests share a single LLM call
+            evaluation_result = self.single_flight.do(
+                cache_key, lambda: self.evaluate_and_cache(rule_set_id, rule_set, feature, action, parameters,
+                                                           cache_key, digest, snapshot))
         
         # Execute action if allowed and requested
         execution_result = None
@@ -116,59 +324,694 @@ class AgenticRuleEngine:
         
         return final_result
     
+    def stream_feature_action(self, user: str, feature: str, action: str, parameters: Dict[str, Any],
+                              rule_set_id: Optional[str] = None, execute_action: bool = True) -> Iterator[Dict[str, Any]]:
+        """
+        Evaluate a feature action with a streamed LLM response, yielding events:
+        
+            {"event": "decision", "decision": ..., "model": ...}  as soon as the decision is parsed
+            {"event": "reason", "text": ...}                      reason generated so far (repeated)
+            {"event": "result", "result": {...}}                  the complete result, always last
+        
+        An allowed action is submitted to the ActionExecutor when the decision event
+        is produced, so it runs while the reason is still being generated; it is
+        recorded with the decision only. In decision-first mode there is no reason
+        to stream and the decision is evaluated in one short call.
+        
+        Concurrent identical requests share one stream; callers that join it get
+        the decision and result events once it has finished.
+        """
+        snapshot = self.snapshot
+        resolved = self.resolve_rule_set(user, rule_set_id, snapshot)
+        if resolved is None:
+            yield {"event": "result", "result": self.no_rule_set_result(user)}
+            return
+        rule_set_id, rule_set = resolved
+        
+        evaluation_result, cache_key, digest = self.evaluate_locally(rule_set_id, rule_set, feature, action, parameters, snapshot)
+        pending_execution = None
+        
+        if evaluation_result is None and self.decision_first:
+            evaluation_result = self.single_flight.do(
+                cache_key, lambda: self.evaluate_and_cache(rule_set_id, rule_set, feature, action, parameters,
+                                                           cache_key, digest, snapshot))
+            yield {"event": "decision", "decision": evaluation_result['decision']}
+        elif evaluation_result is None:
+            context = self.build_evaluation_context(feature, action, parameters, rule_set, rule_set_id, snapshot)
+            # Concurrent identical requests share one stream; the others only get its result
+            events = self.single_flight.stream(
+                cache_key, lambda: self.stream_and_cache(context, feature, cache_key, digest, snapshot))
+            decided = False
+            for event in events:
+                if event['event'] == 'decision' and execute_action and event['decision'] == 'ALLOWED':
+                    pending_execution = self.action_executor.submit_action(
+                        user=user,
+                        feature=feature,
+                        action=action,
+                        parameters=parameters,
+                        rule_evaluation={key: value for key, value in event.items() if key != 'event'}
+                    )
+                if event['event'] == 'result':
+                    evaluation_result = event['result']
+                else:
+                    decided = decided or event['event'] == 'decision'
+                    yield event
+            if not decided:
+                yield {"event": "decision", "model": evaluation_result.get('model'),
+                       "decision": evaluation_result['decision']}
+        else:
+            yield {"event": "decision", "decision": evaluation_result['decision']}
+        
+        execution_result = None
+        if pending_execution is not None:
+            execution_result = pending_execution.result()
+        elif execute_action and evaluation_result['decision'] == 'ALLOWED':
+            execution_result = self.action_executor.execute_action(
+                user=user,
+                feature=feature,
+                action=action,
+                parameters=parameters,
+                rule_evaluation=evaluation_result
+            )
+        
+        final_result = evaluation_result.copy()
+        final_result['execution_result'] = execution_result
+        yield {"event": "result", "result": final_result}
+    
+    async def aevaluate_feature_action(self, user: str, feature: str, action: str,
+                                       parameters: Dict[str, Any], rule_set_id: Optional[str] = None,
+                                       execute_action: bool = True, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Asyncio version of evaluate_feature_action.
+        
+        The LLM call goes through AsyncOpenAI, bounded by the engine's concurrency
+        semaphore and a per-call timeout; action execution runs in a worker thread.
+        """
+        snapshot = self.snapshot
+        resolved = self.resolve_rule_set(user, rule_set_id, snapshot)
+        if resolved is None:
+            return self.no_rule_set_result(user)
+        rule_set_id, rule_set = resolved
+        
+        evaluation_result, cache_key, digest = self.evaluate_locally(rule_set_id, rule_set, feature, action, parameters, snapshot)
+        
+        if evaluation_result is None:
+            evaluation_result = await self.async_single_flight.do(
+                cache_key, lambda: self.aevaluate_and_cache(rule_set_id, rule_set, feature, action, parameters,
+                                                            cache_key, digest, timeout, snapshot))
+        
+        execution_result = None
+        if execute_action and evaluation_result['decision'] == 'ALLOWED':
+            execution_result = await asyncio.to_thread(
+                self.action_executor.execute_action,
+                user=user,
+                feature=feature,
+                action=action,
+                parameters=parameters,
+                rule_evaluation=evaluation_result
+            )
+        
+        final_result = evaluation_result.copy()
+        final_result['execution_result'] = execution_result
+        
+        return final_result
+    
+    def evaluate_batch(self, requests: List[Dict[str, Any]], batch_size: int = BATCH_SIZE) -> List[Dict[str, Any]]:
+        """
+        Evaluate many feature actions, packing requests that share a rule set into one LLM call.
+        
+        Each request is a dict with 'user', 'feature', 'action', 'parameters' and optionally
+        'rule_set_id' and 'execute_action' (default True). Results are returned in input order.
+        Items the batched response does not answer clearly are re-evaluated one by one.
+        """
+        results: List[Optional[Dict[str, Any]]] = [None] * len(requests)
+        # (rule_set_id, models) -> cache_key -> {"request": first request, "indices": [...], "digest": ...}
+        pending: Dict[tuple, Dict[str, Dict[str, Any]]] = {}
+        snapshot = self.snapshot
+        
+        for index, request in enumerate(requests):
+            resolved = self.resolve_rule_set(request['user'], request.get('rule_set_id'), snapshot)
+            if resolved is None:
+                results[index] = self.no_rule_set_result(request['user'])
+                continue
+            rule_set_id, rule_set = resolved
+            
+            evaluation_result, cache_key, digest = self.evaluate_locally(
+                rule_set_id, rule_set, request['feature'], request['action'], request['parameters'], snapshot)
+            if evaluation_result is not None:
+                results[index] = evaluation_result
+                continue
+            
+            # Identical contexts in the same batch share one slot in the prompt; features that
+            # must use the strong model are batched apart so they do not hold the others back
+            models = tuple(self.model_tiers(request['feature'], snapshot)[0])
+            slot = pending.setdefault((rule_set_id, models), {}).setdefault(
+                cache_key, {"request": request, "indices": [], "digest": digest})
+            slot['indices'].append(index)
+        
+        for (rule_set_id, _), slots in pending.items():
+            rule_set = snapshot.data['rule_sets'][rule_set_id]
+            slot_items = list(slots.items())
+            for start in range(0, len(slot_items), batch_size):
+                chunk = slot_items[start:start + batch_size]
+                decisions = self.evaluate_chunk_with_llm(rule_set_id, rule_set, [slot['request'] for _, slot in chunk], snapshot)
+                for (cache_key, slot), evaluation_result in zip(chunk, decisions):
+                    self.decision_cache.put(cache_key, slot['digest'], evaluation_result)
+                    for index in slot['indices']:
+                        results[index] = evaluation_result
+        
+        final_results = []
+        for request, evaluation_result in zip(requests, results):
+            if 'execution_result' in evaluation_result:
+                final_results.append(evaluation_result)
+                continue
+            
+            execution_result = None
+            if request.get('execute_action', True) and evaluation_result['decision'] == 'ALLOWED':
+                execution_result = self.action_executor.execute_action(
+                    user=request['user'],
+                    feature=request['feature'],
+                    action=request['action'],
+                    parameters=request['parameters'],
+                    rule_evaluation=evaluation_result
+                )
+            
+            final_result = evaluation_result.copy()
+            final_result['execution_result'] = execution_result
+            final_results.append(final_result)
+        
+        return final_results
+    
+    def evaluate_chunk_with_llm(self, rule_set_id: str, rule_set: Dict, requests: List[Dict[str, Any]],
+                                snapshot: Optional[RuleSnapshot] = None) -> List[Dict[str, Any]]:
+        """
+        Evaluate requests sharing one rule set in a single LLM call, falling back to single calls.
+        
+        The chunk starts on the fast model when every request's feature allows it; items it
+        answers without enough confidence are sent together to the strong model.
+        """
+        if len(requests) == 1:
+            request = requests[0]
+            return [self.evaluate_request_with_llm(request['feature'], request['action'], request['parameters'],
+                                                   rule_set, rule_set_id, snapshot)]
+        
+        tiers = [self.model_tiers(request['feature'], snapshot) for request in requests]
+        models = min((item_models for item_models, _ in tiers), key=len)
+        decisions: List[Optional[Dict[str, Any]]] = [None] * len(requests)
+        unanswered = list(range(len(requests)))
+        for tier, model in enumerate(models):
+            last_tier = tier == len(models) - 1
+            chunk = [requests[position] for position in unanswered]
+            try:
+                answers = self.call_batch_llm(chunk, rule_set, rule_set_id, snapshot, model)
+            except Exception:
+                answers = {}
+            # Rule numbers in a decision-first answer refer to the rules listed in the batch prompt
+            rules = self.batch_rules(chunk, rule_set, rule_set_id, snapshot) if self.decision_first else None
+            escalated = []
+            for offset, position in enumerate(unanswered):
+                result = answers.get(offset)
+                if result is None or not (last_tier or self.is_confident(result, tiers[position][1])):
+                    escalated.append(position)
+                    continue
+                result['model'] = model
+                if tier > 0:
+                    result['escalated_from'] = models[0]
+                if self.decision_first:
+                    request = requests[position]
+                    result = self.complete_decision(result, request['feature'], request['action'],
+                                                    request['parameters'], rules)
+                decisions[position] = result
+            unanswered = escalated
+            if not unanswered:
+                break
+        
+        for position in unanswered:
+            request = requests[position]
+            decisions[position] = self.evaluate_request_with_llm(request['feature'], request['action'],
+                                                                 request['parameters'], rule_set, rule_set_id, snapshot)
+        
+        return decisions
+    
+    def call_batch_llm(self, requests: List[Dict[str, Any]], rule_set: Dict, rule_set_id: Optional[str],
+                       snapshot: Optional[RuleSnapshot], model: str) -> Dict[int, Dict[str, Any]]:
+        """One batched LLM call; the clear decisions it returns, keyed by position in requests"""
+        context = self.build_batch_evaluation_context(requests, rule_set, rule_set_id, snapshot)
+        tokens_per_item = BATCH_DECISION_TOKENS_PER_ITEM if self.decision_first else BATCH_TOKENS_PER_ITEM
+        # Batched prompts always use the line-based format
+        request = self.build_completion_request(context, model=model, max_tokens=tokens_per_item * len(requests),
+                                                structured=False)
+        response = self.transport.call(
+            lambda: self.client.chat.completions.create(**request, timeout=self.llm_timeout), key=model)
+        parsed = self.parse_batch_llm_response(response.choices[0].message.content)
+        return {number - 1: result for number, result in parsed.items()
+                if 1 <= number <= len(requests) and result['decision'] in ('ALLOWED', 'DENIED')}
+    
+    def resolve_rule_set(self, user: str, rule_set_id: Optional[str] = None,
+                         snapshot: Optional[RuleSnapshot] = None) -> Optional[tuple]:
+        """Return (rule_set_id, rule_set) for a user, or None if no rule set applies"""
+        data = (snapshot or self.snapshot).data
+        if rule_set_id is None:
+            rule_set_id = data['user_assignments'].get(user)
+        
+        if not rule_set_id or rule_set_id not in data['rule_sets']:
+            return None
+        
+        return rule_set_id, data['rule_sets'][rule_set_id]
+    
+    def no_rule_set_result(self, user: str) -> Dict[str, Any]:
+        """Result returned when a user has no usable rule set"""
+        return {
+            "decision": "ERROR",
+            "reason": f"No rule set found for user {user}",
+            "rule_violated": None,
+            "execution_result": None
+        }
+    
+    def evaluate_locally(self, rule_set_id: str, rule_set: Dict, feature: str, action: str,
+                         parameters: Dict[str, Any], snapshot: Optional[RuleSnapshot] = None) -> tuple:
+        """
+        Try to decide without the LLM.
+        
+        Returns (result or None, cache_key, rules_digest); the key and digest are
+        used to store the LLM result when no local decision was possible.
+        """
+        snapshot = snapshot or self.snapshot
+        # Machine-checkable rules are decided locally without calling the LLM
+        compiled_rule_set = snapshot.compiled_rule_sets.get(rule_set_id)
+        evaluation_result = compiled_rule_set.evaluate(feature, action, parameters) if compiled_rule_set else None
+        if evaluation_result is not None:
+            return evaluation_result, None, None
+        
+        # Otherwise reuse a previous decision for the same rules and context if we have one
+        digest = snapshot.rule_set_digests.get(rule_set_id) or rule_set_digest(rule_set)
+        cache_key = decision_key(digest, feature, action, parameters)
+        return self.decision_cache.get(cache_key), cache_key, digest
+    
+    def evaluate_and_cache(self, rule_set_id: str, rule_set: Dict, feature: str, action: str, parameters: Dict[str, Any],
+                           cache_key: str, digest: str, snapshot: Optional[RuleSnapshot] = None) -> Dict[str, Any]:
+        """Evaluate with the LLM and remember the decision"""
+        # A call for the same key may have completed since the caller's cache lookup
+        evaluation_result = self.decision_cache.get(cache_key, count=False)
+        if evaluation_result is not None:
+            return evaluation_result
+        
+        evaluation_result = self.evaluate_request_with_llm(feature, action, parameters, rule_set, rule_set_id, snapshot)
+        self.decision_cache.put(cache_key, digest, evaluation_result)
+        return evaluation_result
+    
+    def evaluate_request_with_llm(self, feature: str, action: str, parameters: Dict[str, Any], rule_set: Dict,
+                                  rule_set_id: Optional[str] = None,
+                                  snapshot: Optional[RuleSnapshot] = None) -> Dict[str, Any]:
+        """Evaluate one request with the LLM, completing and recording decision-first answers"""
+        # Build context for LLM
+        context = self.build_evaluation_context(feature, action, parameters, rule_set, rule_set_id, snapshot)
+        
+        # Evaluate with LLM
+        evaluation_result = self.evaluate_with_llm(context, feature, snapshot)
+        if self.decision_first:
+            evaluation_result = self.complete_decision(evaluation_result, feature, action, parameters,
+                                                       self.relevant_rules(feature, action, rule_set, rule_set_id, snapshot))
+        return evaluation_result
+    
+    async def aevaluate_and_cache(self, rule_set_id: str, rule_set: Dict, feature: str, action: str, parameters: Dict[str, Any],
+                                  cache_key: str, digest: str, timeout: Optional[float] = None,
+                                  snapshot: Optional[RuleSnapshot] = None) -> Dict[str, Any]:
+        """Async counterpart of evaluate_and_cache"""
+        evaluation_result = self.decision_cache.get(cache_key, count=False)
+        if evaluation_result is not None:
+            return evaluation_result
+        
+        context = self.build_evaluation_context(feature, action, parameters, rule_set, rule_set_id, snapshot)
+        evaluation_result = await self.aevaluate_with_llm(context, timeout=timeout, feature=feature, snapshot=snapshot)
+        if self.decision_first:
+            evaluation_result = await asyncio.to_thread(
+                self.complete_decision, evaluation_result, feature, action, parameters,
+                self.relevant_rules(feature, action, rule_set, rule_set_id, snapshot))
+        self.decision_cache.put(cache_key, digest, evaluation_result)
+        return evaluation_result
+    
+    def stream_and_cache(self, context: str, feature: str, cache_key: str, digest: str,
+                         snapshot: Optional[RuleSnapshot] = None) -> Iterator[Dict[str, Any]]:
+        """Streaming counterpart of evaluate_and_cache, yielding the events of stream_with_llm"""
+        evaluation_result = self.decision_cache.get(cache_key, count=False)
+        if evaluation_result is not None:
+            yield {"event": "result", "result": evaluation_result}
+            return
+        
+        for event in self.stream_with_llm(context, feature, snapshot):
+            # A result overridden to agree with its early decision is not worth reusing
+            if event['event'] == 'result' and not event.get('overridden'):
+                self.decision_cache.put(cache_key, digest, event['result'])
+            yield event
+    
     def build_evaluation_context(self, feature: str, action: str, 
-                               parameters: Dict[str, Any], rule_set: Dict) -> str:
-        """Build context string for LLM evaluation"""
+                               parameters: Dict[str, Any], rule_set: Dict,
+                               rule_set_id: Optional[str] = None,
+                               snapshot: Optional[RuleSnapshot] = None) -> str:
+        """
+        Build context string for LLM evaluation.
         
-        # Format parameters for display
-        param_display = []
-        for param_name, param_value in parameters.items():
-            if isinstance(param_value, datetime):
-                param_display.append(f"• {param_name}: {param_value.strftime('%Y-%m-%d %H:%M')}")
-            else:
-                param_display.append(f"• {param_name}: {param_value}")
+        The static part (relevant rules, instructions, response format) comes first and
+        is rendered once per rule set and selection of relevant rules, so only the
+        request section is built per call. Keying on the selected rule positions
+        rather than the caller's feature/action keeps the memo bounded.
+        """
+        snapshot = snapshot or self.snapshot
+        rule_index = self.rule_index(rule_set, rule_set_id, snapshot)
+        positions = rule_index.relevant_positions(feature, action)
+        prefix_key = (rule_set_id, positions)
+        prefix = snapshot.prompt_prefixes.get(prefix_key) if rule_set_id else None
+        if prefix is None:
+            prefix = self.build_prompt_prefix([rule_index.rules[position] for position in positions])
+            if rule_set_id:
+                snapshot.prompt_prefixes[prefix_key] = prefix
         
-        context = f"""
-        You are an intelligent rule evaluator for an agentic application system.
+        return prefix + self.build_request_section(feature, action, parameters)
+    
+    def build_request_section(self, feature: str, action: str, parameters: Dict[str, Any]) -> str:
+        """Request-specific part of the single evaluation prompt"""
+        param_display = self.format_parameters(parameters)
         
+        return f"""
         **FEATURE:** [{feature}]
         **ACTION:** {action}
         **PARAMETERS:**
         {chr(10).join(param_display)}
+        """
+    
+    def relevant_rules(self, feature: str, action: str, rule_set: Dict,
+                       rule_set_id: Optional[str] = None, snapshot: Optional[RuleSnapshot] = None) -> List[str]:
+        """Rules of a rule set that mention the feature/action, plus untagged rules"""
+        return self.rule_index(rule_set, rule_set_id, snapshot).relevant_rules(feature, action)
+    
+    def rule_index(self, rule_set: Dict, rule_set_id: Optional[str] = None,
+                   snapshot: Optional[RuleSnapshot] = None) -> RuleSetIndex:
+        """Precompiled rule index of a rule set, or a fresh one for rule sets outside the snapshot"""
+        snapshot = snapshot or self.snapshot
+        rule_index = snapshot.rule_indexes.get(rule_set_id) if rule_set_id else None
+        if rule_index is None:
+            rule_index = RuleSetIndex(rule_set['rules'])
+        return rule_index
+    
+    def build_prompt_prefix(self, rules: List[str]) -> str:
+        """Static, request-independent part of the single evaluation prompt"""
+        if self.decision_first:
+            return self.build_decision_prompt_prefix(rules)
+        return f"""
+        You are an intelligent rule evaluator for an agentic application system.
         
         **APPLICABLE RULES:**
-        {chr(10).join(f"• {rule}" for rule in rule_set['rules'])}
+        {self.format_rules(rules)}
         
         **EVALUATION INSTRUCTIONS:**
-        1. Identify which rules apply to the [{feature}] feature and {action} action
+        1. Identify which rules apply to the feature and action in the request below
         2. Check if the provided parameters satisfy the rule conditions
         3. Consider any time, location, or other constraints mentioned in the rules
         4. Provide a clear decision with reasoning
         
         **RESPONSE FORMAT:**
-        Decision: [ALLOWED/DENIED]
-        Reason: [Brief explanation of which rule(s) were evaluated and why the decision was made]
-        Rule Violated: [If denied, specify which rule was violated]
+        {STRUCTURED_RESPONSE_FORMAT if self.structured_output else TEXT_RESPONSE_FORMAT}
+        
+        **REQUEST:**"""
+    
+    def build_decision_prompt_prefix(self, rules: List[str]) -> str:
+        """Prompt prefix of a decision-first evaluation: numbered rules and no reason"""
+        return f"""
+        You are an intelligent rule evaluator for an agentic application system.
+        
+        **APPLICABLE RULES:**
+        {self.format_numbered_rules(rules)}
+        
+        **EVALUATION INSTRUCTIONS:**
+        1. Identify which rules apply to the feature and action in the request below
+        2. Check if the provided parameters satisfy the rule conditions
+        3. Consider any time, location, or other constraints mentioned in the rules
+        4. Answer with the decision and the number of the rule that decided it; do not explain
+        
+        **RESPONSE FORMAT:**
+        {DECISION_STRUCTURED_RESPONSE_FORMAT if self.structured_output else DECISION_TEXT_RESPONSE_FORMAT}
+        
+        **REQUEST:**"""
+    
+    def build_batch_evaluation_context(self, requests: List[Dict[str, Any]], rule_set: Dict,
+                                       rule_set_id: Optional[str] = None,
+                                       snapshot: Optional[RuleSnapshot] = None) -> str:
+        """Build one context string listing several numbered requests against the same rules"""
+        snapshot = snapshot or self.snapshot
+        rule_index = self.rule_index(rule_set, rule_set_id, snapshot)
+        positions = self.batch_rule_positions(rule_index, requests)
+        prefix = snapshot.batch_prompt_prefixes.get((rule_set_id, positions)) if rule_set_id else None
+        if prefix is None:
+            prefix = self.build_batch_prompt_prefix([rule_index.rules[position] for position in positions])
+            if rule_set_id:
+                snapshot.batch_prompt_prefixes[(rule_set_id, positions)] = prefix
+        
+        request_blocks = []
+        for number, request in enumerate(requests, 1):
+            request_blocks.append(
+                f"Request {number}:\n"
+                f"**FEATURE:** [{request['feature']}]\n"
+                f"**ACTION:** {request['action']}\n"
+                f"**PARAMETERS:**\n" + chr(10).join(self.format_parameters(request['parameters']))
+            )
+        
+        return prefix + "\n" + (chr(10) + chr(10)).join(request_blocks) + "\n"
+    
+    def batch_rule_positions(self, rule_index: RuleSetIndex, requests: List[Dict[str, Any]]) -> tuple:
+        """Positions of the rules a batch prompt carries: those relevant to any of its requests"""
+        relevant = set()
+        for request in requests:
+            relevant.update(rule_index.relevant_positions(request['feature'], request['action']))
+        return tuple(sorted(relevant))
+    
+    def batch_rules(self, requests: List[Dict[str, Any]], rule_set: Dict, rule_set_id: Optional[str] = None,
+                    snapshot: Optional[RuleSnapshot] = None) -> List[str]:
+        """Rules listed in the batch prompt for these requests, in prompt order"""
+        rule_index = self.rule_index(rule_set, rule_set_id, snapshot)
+        return [rule_index.rules[position] for position in self.batch_rule_positions(rule_index, requests)]
+    
+    def build_batch_prompt_prefix(self, rules: List[str]) -> str:
+        """Static, request-independent part of the batched evaluation prompt"""
+        if self.decision_first:
+            return self.build_batch_decision_prompt_prefix(rules)
+        return f"""
+        You are an intelligent rule evaluator for an agentic application system.
+        
+        **APPLICABLE RULES:**
+        {self.format_rules(rules)}
+        
+        **EVALUATION INSTRUCTIONS:**
+        1. Evaluate every request below independently against the rules above
+        2. For each request, identify which rules apply to its feature and action
+        3. Check if the provided parameters satisfy the rule conditions
+        4. Consider any time, location, or other constraints mentioned in the rules
+        
+        **RESPONSE FORMAT (repeat for every request, in order):**
+        Request <number>:
+        {self.batch_response_format(TEXT_RESPONSE_FORMAT)}
+        
+        **REQUESTS:**"""
+    
+    def build_batch_decision_prompt_prefix(self, rules: List[str]) -> str:
+        """Batched counterpart of build_decision_prompt_prefix"""
+        return f"""
+        You are an intelligent rule evaluator for an agentic application system.
+        
+        **APPLICABLE RULES:**
+        {self.format_numbered_rules(rules)}
+        
+        **EVALUATION INSTRUCTIONS:**
+        1. Evaluate every request below independently against the rules above
+        2. For each request, identify which rules apply to its feature and action
+        3. Check if the provided parameters satisfy the rule conditions
+        4. Answer with the decision and the number of the rule that decided it; do not explain
+        
+        **RESPONSE FORMAT (repeat for every request, in order):**
+        Request <number>:
+        {self.batch_response_format(DECISION_TEXT_RESPONSE_FORMAT)}
+        
+        **REQUESTS:**"""
+    
+    def batch_response_format(self, response_format: str) -> str:
+        """Per-request answer format of a batched prompt, with a confidence line when answers may escalate"""
+        if self.fast_model is None:
+            return response_format
+        return response_format + chr(10) + "        " + BATCH_CONFIDENCE_LINE
+    
+    def format_rules(self, rules: List[str]) -> str:
+        """Format rules as bullet lines for the LLM prompt"""
+        if not rules:
+            return "• No rules apply to this feature and action."
+        return chr(10).join(f"• {rule}" for rule in rules)
+    
+    def format_numbered_rules(self, rules: List[str]) -> str:
+        """Format rules as numbered lines, so a response can name a rule by number"""
+        if not rules:
+            return "No rules apply to this feature and action."
+        return chr(10).join(f"{number}. {rule}" for number, rule in enumerate(rules, 1))
+    
+    def format_parameters(self, parameters: Dict[str, Any]) -> List[str]:
+        """Format parameters as bullet lines for the LLM prompt"""
+        param_display = []
+        for param_name, param_value in parameters.items():
+            if isinstance(param_value, datetime):
+                param_display.append(f"• {param_name}: {param_value.strftime('%Y-%m-%d %H:%M')}")
+            else:
+                param_display.append(f"• {param_name}: {param_value}")
+        return param_display
+    
+    def model_tiers(self, feature: Optional[str] = None, snapshot: Optional[RuleSnapshot] = None) -> tuple:
         """
+        Models to ask, in order, and the confidence needed to stop at the first one.
         
-        return context
+        A feature definition can set "model_tier": "strong" to skip the fast model
+        (high-risk features) and "confidence_threshold" to change when to escalate.
+        Definitions are read from the evaluation's rules snapshot.
+        """
+        definition = {}
+        if feature:
+            definition = (snapshot or self.snapshot).data.get('feature_definitions', {}).get(feature.strip().upper(), {})
+        threshold = definition.get('confidence_threshold', self.escalation_confidence)
+        if self.fast_model is None or definition.get('model_tier') == 'strong':
+            return [self.strong_model], threshold
+        return [self.fast_model, self.strong_model], threshold
+    
+    def is_confident(self, result: Dict[str, Any], threshold: float) -> bool:
+        """Whether a fast-tier answer can be used without escalating"""
+        confidence_score = result.get('confidence_score')
+        return (result['decision'] in ('ALLOWED', 'DENIED')
+                and confidence_score is not None and confidence_score >= threshold)
+    
+    def evaluate_with_llm(self, context: str, feature: Optional[str] = None,
+                          snapshot: Optional[RuleSnapshot] = None) -> Dict[str, Any]:
+        """Evaluate rules using LLM, escalating to the strong model when the fast one is unsure"""
+        models, threshold = self.model_tiers(feature, snapshot)
+        for tier, model in enumerate(models):
+            result = self.call_llm(context, model)
+            if tier == len(models) - 1 or self.is_confident(result, threshold):
+                result['model'] = model
+                if tier > 0:
+                    result['escalated_from'] = models[0]
+                return result
+    
+    async def aevaluate_with_llm(self, context: str, timeout: Optional[float] = None,
+                                 feature: Optional[str] = None,
+                                 snapshot: Optional[RuleSnapshot] = None) -> Dict[str, Any]:
+        """Async counterpart of evaluate_with_llm"""
+        models, threshold = self.model_tiers(feature, snapshot)
+        for tier, model in enumerate(models):
+            result = await self.acall_llm(context, model, timeout)
+            if tier == len(models) - 1 or self.is_confident(result, threshold):
+                result['model'] = model
+                if tier > 0:
+                    result['escalated_from'] = models[0]
+                return result
+    
+    def stream_with_llm(self, context: str, feature: Optional[str] = None,
+                        snapshot: Optional[RuleSnapshot] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Streaming counterpart of evaluate_with_llm, yielding decision, reason and
+        result events (see stream_feature_action). A fast-tier stream whose early
+        confidence is too low is abandoned right away and the strong model is asked.
+        The result event has "overridden": True when the complete response contradicted
+        the early decision and the result was made to agree with it.
+        """
+        models, threshold = self.model_tiers(feature, snapshot)
+        for tier, model in enumerate(models):
+            last_tier = tier == len(models) - 1
+            parser = EvaluationStreamParser(self.structured_output, need_confidence=not last_tier)
+            committed = None
+            reason_sent = ""
+            escalate = False
+            stream = None
+            try:
+                request = self.build_completion_request(context, model=model, stream=True)
+                # Only opening the stream is retried; a stream is never sent twice
+                stream = self.transport.call(
+                    lambda: self.client.chat.completions.create(**request, timeout=self.llm_timeout),
+                    key=model, hedge=False)
+                for chunk in stream:
+                    if not chunk.choices:
+                        continue
+                    early = parser.feed(chunk.choices[0].delta.content or "")
+                    if early is not None:
+                        if not last_tier and not self.is_confident(early, threshold):
+                            escalate = True
+                            break
+                        committed = early
+                        yield {"event": "decision", "model": model, **early}
+                    if committed is not None:
+                        reason = parser.reason()
+                        if reason != reason_sent:
+                            reason_sent = reason
+                            yield {"event": "reason", "text": reason}
+                result = self.parse_evaluation_response(parser.text)
+            except Exception as e:
+                result = {
+                    "decision": "ERROR",
+                    "reason": f"Failed to evaluate rules: {str(e)}",
+                    "rule_violated": None
+                }
+            finally:
+                if stream is not None and hasattr(stream, 'close'):
+                    stream.close()
+            
+            if escalate or (committed is None and not last_tier and not self.is_confident(result, threshold)):
+                continue
+            overridden = committed is not None and result['decision'] != committed['decision']
+            if overridden:
+                # The action may already be running on the early decision; the result must agree with it
+                result = {"decision": committed['decision'], "reason": result['reason'],
+                          "rule_violated": result.get('rule_violated'),
+                          "confidence_score": committed.get('confidence_score')}
+            result['model'] = model
+            if tier > 0:
+                result['escalated_from'] = models[0]
+            if committed is None:
+                yield {"event": "decision", "model": model, "decision": result['decision'],
+                       "confidence_score": result.get('confidence_score')}
+            yield {"event": "result", "result": result, "overridden": overridden}
+            return
     
-    def evaluate_with_llm(self, context: str) -> Dict[str, Any]:
-        """Evaluate rules using LLM"""
+    def call_llm(self, context: str, model: str) -> Dict[str, Any]:
+        """Evaluate rules with one model"""
         try:
-            response = client.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {"role": "system", "content": "You are an expert rule evaluator for agentic applications. Be precise and follow the response format exactly."},
-                    {"role": "user", "content": context}
-                ],
-                max_tokens=300,
-                temperature=0
-            )
+            request = self.build_completion_request(context, model=model)
+            response = self.transport.call(
+                lambda: self.client.chat.completions.create(**request, timeout=self.llm_timeout), key=model)
+            
+            result_text = response.choices[0].message.content
+            return self.parse_evaluation_response(result_text)
+            
+        except Exception as e:
+            return {
+                "decision": "ERROR",
+                "reason": f"Failed to evaluate rules: {str(e)}",
+                "rule_violated": None
+            }
+    
+    async def acall_llm(self, context: str, model: str, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """Evaluate rules with one model using AsyncOpenAI, limited by the concurrency semaphore"""
+        timeout = self.llm_timeout if timeout is None else timeout
+        try:
+            request = self.build_completion_request(context, model=model)
+            async with self.get_async_semaphore():
+                # The timeout bounds the whole call, including retries and a hedged duplicate
+                response = await asyncio.wait_for(
+                    self.transport.acall(lambda: self.async_client.chat.completions.create(**request), key=model),
+                    timeout=timeout
+                )
             
             result_text = response.choices[0].message.content
-            return self.parse_llm_response(result_text)
+            return self.parse_evaluation_response(result_text)
             
+        except asyncio.TimeoutError:
+            return {
+                "decision": "ERROR",
+                "reason": f"Failed to evaluate rules: LLM call timed out after {timeout} seconds",
+                "rule_violated": None
+            }
         except Exception as e:
             return {
                 "decision": "ERROR",
@@ -176,6 +1019,177 @@ class AgenticRuleEngine:
                 "rule_violated": None
             }
     
+    def get_async_semaphore(self) -> asyncio.Semaphore:
+        """Concurrency semaphore for the running event loop"""
+        loop = asyncio.get_running_loop()
+        if self._async_semaphore is None or self._async_semaphore_loop is not loop:
+            self._async_semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._async_semaphore_loop = loop
+        return self._async_semaphore
+    
+    def build_completion_request(self, context: str, max_tokens: Optional[int] = None,
+                                 structured: Optional[bool] = None, model: Optional[str] = None,
+                                 stream: bool = False) -> Dict[str, Any]:
+        """Chat completion arguments shared by the sync and async evaluators"""
+        structured = self.structured_output if structured is None else structured
+        request = {
+            "model": model or self.strong_model,
+            "messages": [
+                {"role": "system", "content": EVALUATOR_SYSTEM_PROMPT},
+                {"role": "user", "content": context}
+            ],
+            "max_tokens": max_tokens or self.max_tokens,
+            "temperature": 0
+        }
+        if structured:
+            schema = DECISION_RESPONSE_SCHEMA if self.decision_first else EVALUATION_RESPONSE_SCHEMA
+            request["response_format"] = {"type": "json_schema", "json_schema": schema}
+        if stream:
+            request["stream"] = True
+        return request
+    
+    def parse_evaluation_response(self, response_text: str) -> Dict[str, Any]:
+        """Parse a single-request response according to the configured output mode"""
+        if self.decision_first:
+            return self.parse_decision_response(response_text)
+        if self.structured_output:
+            return self.parse_structured_response(response_text)
+        return self.parse_llm_response(response_text)
+    
+    def parse_structured_response(self, response_text: str) -> Dict[str, Any]:
+        """Parse a JSON-schema response, falling back to the line-based parser"""
+        try:
+            payload = json.loads(response_text)
+        except (TypeError, json.JSONDecodeError):
+            return self.parse_llm_response(response_text or "")
+        
+        if not isinstance(payload, dict) or payload.get('decision') not in ('ALLOWED', 'DENIED'):
+            return {
+                "decision": "UNKNOWN",
+                "reason": "No clear decision provided",
+                "rule_violated": None
+            }
+        
+        try:
+            confidence_score = float(payload.get('confidence_score'))
+        except (TypeError, ValueError):
+            confidence_score = None
+        
+        return {
+            "decision": payload['decision'],
+            "reason": payload.get('reason') or "No reason provided",
+            "rule_violated": payload.get('rule_violated') or None,
+            "confidence_score": confidence_score
+        }
+    
+    def parse_decision_response(self, response_text: str) -> Dict[str, Any]:
+        """Parse a decision-first response (JSON or "Decision:"/"Rule:" lines)"""
+        result = {
+            "decision": "UNKNOWN",
+            "reason": "No clear decision provided",
+            "rule_violated": None
+        }
+        try:
+            payload = json.loads(response_text)
+        except (TypeError, json.JSONDecodeError):
+            payload = {}
+            for line in (response_text or "").strip().split('\n'):
+                name, _, value = line.strip().partition(':')
+                if name in DECISION_LINE_FIELDS:
+                    payload[DECISION_LINE_FIELDS[name]] = value.strip()
+        
+        if not isinstance(payload, dict) or payload.get('decision') not in ('ALLOWED', 'DENIED'):
+            return result
+        
+        try:
+            rule_number = int(payload.get('rule_number'))
+        except (TypeError, ValueError):
+            rule_number = None
+        try:
+            confidence_score = float(payload.get('confidence_score'))
+        except (TypeError, ValueError):
+            confidence_score = None
+        
+        result.update(decision=payload['decision'], rule_number=rule_number, confidence_score=confidence_score)
+        return result
+    
+    def complete_decision(self, result: Dict[str, Any], feature: str, action: str,
+                          parameters: Dict[str, Any], rules: List[str]) -> Dict[str, Any]:
+        """
+        Turn a decision-first answer into an evaluation result and record it in the
+        action database under a new decision_id for get_explanation.
+        
+        The reason names the deciding rule; the full explanation is generated later.
+        """
+        rule_number = result.pop('rule_number', None)
+        if result['decision'] not in ('ALLOWED', 'DENIED'):
+            return result
+        
+        if rule_number is not None and not 1 <= rule_number <= len(rules):
+            rule_number = None
+        rule = rules[rule_number - 1] if rule_number else None
+        decision_id = uuid.uuid4().hex
+        result.update(
+            reason=f"Decided by rule {rule_number}: {rule}" if rule else "No single rule decided this request",
+            rule_violated=rule if result['decision'] == 'DENIED' else None,
+            rule_id=rule_number,
+            decision_id=decision_id
+        )
+        
+        recorded = self.action_executor.record_decision(
+            decision_id, feature, action, result, rules, self.build_request_section(feature, action, parameters))
+        if self.explainer is not None:
+            # Explain once the decision is stored (the buffered writer stores it asynchronously)
+            recorded.add_done_callback(lambda _: self.explainer.submit(self.get_explanation, decision_id))
+        return result
+    
+    def get_explanation(self, decision_id: str) -> Dict[str, Any]:
+        """
+        Human-readable reason for a decision-first evaluation, generated on first
+        request and stored with the decision.
+        """
+        decision = self.action_executor.get_decision(decision_id)
+        if decision is None:
+            return {"success": False, "decision_id": decision_id,
+                    "message": f"❌ No decision found with id {decision_id}"}
+        
+        explanation = decision['explanation']
+        if explanation is None:
+            try:
+                # Concurrent requests for the same decision share one LLM call
+                explanation = self.single_flight.do(f"explanation:{decision_id}",
+                                                    lambda: self.generate_explanation(decision))
+            except Exception as e:
+                return {"success": False, "decision_id": decision_id,
+                        "message": f"❌ Failed to generate explanation: {str(e)}"}
+        
+        return {
+            "success": True,
+            "decision_id": decision_id,
+            "decision": decision['decision'],
+            "feature": decision['feature'],
+            "action": decision['action'],
+            "explanation": explanation
+        }
+    
+    def generate_explanation(self, decision: Dict[str, Any]) -> str:
+        """Ask the LLM to explain a recorded decision and store the explanation"""
+        rules = decision['rules']
+        rule_id = decision['rule_id']
+        prompt = EXPLANATION_PROMPT.format(
+            rules=self.format_numbered_rules(rules),
+            request=decision['request'],
+            decision=decision['decision'],
+            rule=f"{rule_id}. {rules[rule_id - 1]}" if rule_id else "None"
+        )
+        request = self.build_completion_request(prompt, max_tokens=TEXT_MAX_TOKENS, structured=False,
+                                                model=self.fast_model or self.strong_model)
+        response = self.transport.call(
+            lambda: self.client.chat.completions.create(**request, timeout=self.llm_timeout), key=request['model'])
+        explanation = (response.choices[0].message.content or "").strip()
+        self.action_executor.save_explanation(decision['decision_id'], explanation)
+        return explanation
+    
     def parse_llm_response(self, response_text: str) -> Dict[str, Any]:
         """Parse the LLM response into structured format"""
         lines = response_text.strip().split('\n')
@@ -196,45 +1210,107 @@ class AgenticRuleEngine:
             elif line.startswith("Rule Violated:"):
                 rule_violated = line.replace("Rule Violated:", "").strip()
                 result["rule_violated"] = rule_violated if rule_violated != "None" else None
+            elif line.startswith("Confidence:"):
+                try:
+                    result["confidence_score"] = float(line.replace("Confidence:", "").strip())
+                except ValueError:
+                    pass
         
         return result
     
+    def parse_batch_llm_response(self, response_text: str) -> Dict[int, Dict[str, Any]]:
+        """Split a batched response into per-request results keyed by request number"""
+        results = {}
+        blocks = re.split(r'^\s*\**Request\s+(\d+)\s*:?\**\s*:?\s*$', response_text, flags=re.MULTILINE)
+        # re.split yields [preamble, number, block, number, block, ...]
+        parse = self.parse_decision_response if self.decision_first else self.parse_llm_response
+        for number, block in zip(blocks[1::2], blocks[2::2]):
+            results[int(number)] = parse(block)
+        return results
+    
     def get_available_features(self) -> List[str]:
         """Get list of all available features"""
-        return self.features
+        return self.extract_features()
     
     def get_available_parameters(self) -> List[str]:
         """Get list of all available parameters"""
-        return self.parameters
+        return self.extract_parameters()
+    
+    def get_feature_actions(self, feature: str) -> List[str]:
+        """Actions of a feature, from its definition and from the rules"""
+        definition = self.data.get('feature_definitions', {}).get(feature, {})
+        actions = list(definition.get('actions', []))
+        return actions + [action for action in self.snapshot.tag_index.actions_for(feature) if action not in actions]
+    
+    def get_feature_parameters(self, feature: str, action: Optional[str] = None) -> List[str]:
+        """Parameters relevant to a feature (and action), from its definition and from the rules"""
+        definition = self.data.get('feature_definitions', {}).get(feature, {})
+        parameters = list(definition.get('parameters', []))
+        return parameters + [parameter for parameter in self.snapshot.tag_index.parameters_for(feature, action)
+                             if parameter not in parameters]
     
     def add_rule_set(self, name: str, rules: List[str]) -> str:
         """Add a new rule set"""
-        rule_set_id = f"rule_set_{len(self.data['rule_sets']) + 1}"
-        self.data['rule_sets'][rule_set_id] = {
+        # Copy on write: evaluations holding the current snapshot must not see the change
+        data = dict(self.data)
+        data['rule_sets'] = dict(data['rule_sets'])
+        rule_set_id = f"rule_set_{len(data['rule_sets']) + 1}"
+        data['rule_sets'][rule_set_id] = {
             "name": name,
             "rules": rules
         }
-        self.save_rules()
-        # Refresh features and parameters
-        self.features = self.extract_features()
-        self.parameters = self.extract_parameters()
+        self.rule_store.put_rule_set(rule_set_id, data['rule_sets'][rule_set_id], data)
+        self.data = data
         return rule_set_id
     
     def assign_user_to_rule_set(self, user: str, rule_set_id: str) -> bool:
         """Assign a user to a rule set"""
         if rule_set_id in self.data['rule_sets']:
-            self.data['user_assignments'][user] = rule_set_id
-            self.save_rules()
+            data = dict(self.data)
+            data['user_assignments'] = dict(data['user_assignments'])
+            data['user_assignments'][user] = rule_set_id
+            self.rule_store.put_assignments({user: rule_set_id}, data)
+            self.data = data
             return True
         return False
+    
+    def assign_users_bulk(self, mapping: Assignments) -> Dict[str, Any]:
+        """
+        Assign many users at once with a single write to the rule store.
+        
+        mapping is a {user: rule_set_id} dict, or an iterable of (user, rule_set_id)
+        pairs (see iter_assignments) that is streamed to the store. Nothing is
+        assigned if any rule set id is unknown.
+        """
+        data = dict(self.data)
+        data['user_assignments'] = dict(data['user_assignments'])
+        result = apply_assignments(self.rule_store, data, mapping)
+        if result['success']:
+            self.data = data
+        return result
+    
+    def assign_users_from_file(self, stream, file_format: str = 'csv') -> Dict[str, Any]:
+        """Bulk-assign users from a CSV ("user,rule_set_id") or JSONL stream"""
+        try:
+            return self.assign_users_bulk(iter_assignments(stream, file_format))
+        except ValueError as e:
+            return {"success": False, "assigned": 0, "invalid_rule_sets": [], "message": f"❌ {e}"}
+
+@st.cache_resource
+def get_shared_engine(rules_file: str = 'agentic_rules.json') -> AgenticRuleEngine:
+    """Process-wide engine shared by all Streamlit sessions and reruns"""
+    engine = AgenticRuleEngine(rules_file, streaming=True)
+    engine.start_watching()
+    return engine
 
 def agentic_rule_interface():
     """Main interface for the agentic rule engine"""
     st.title("🤖 Agentic Rule Engine")
     st.markdown("**General-Purpose Feature-Parameter-Rule (FPR) Architecture**")
     
-    # Initialize the rule engine
-    engine = AgenticRuleEngine()
+    # Shared rule engine, reloaded only when the rules file changes
+    engine = get_shared_engine()
+    engine.reload_if_changed()
     
     # Sidebar for navigation
     page = st.sidebar.selectbox(
@@ -274,13 +1350,15 @@ def feature_actions_page(engine: AgenticRuleEngine):
     feature_choice = st.selectbox("Select Feature", available_features)
     
     # Action input
-    action_choice = st.text_input("Enter Action", placeholder="e.g., CHECK-IN, SUBMIT, REQUEST")
+    feature_actions = engine.get_feature_actions(feature_choice)
+    action_choice = st.text_input("Enter Action",
+                                  placeholder=f"e.g., {', '.join(feature_actions[:3])}" if feature_actions else "e.g., CHECK-IN, SUBMIT, REQUEST")
     
-    # Dynamic parameter input based on available parameters
+    # Parameter inputs for the selected feature only
     st.subheader("📝 Parameters")
     parameters = {}
     
-    available_params = engine.get_available_parameters()
+    available_params = engine.get_feature_parameters(feature_choice, action_choice.strip().upper() or None)
     for param in available_params:
         if param == "TIME":
             param_value = st.time_input(f"[{param}]", value=datetime.now().time())
@@ -331,7 +1409,26 @@ def feature_actions_page(engine: AgenticRuleEngine):
     
     # Execute action
     if st.button("🚀 Execute Action", type="primary"):
-        if action_choice and parameters:
+        if action_choice and parameters and engine.streaming:
+            # Show the decision as soon as it arrives and the reason while it is generated
+            progress = st.empty()
+            decision = None
+            for event in engine.stream_feature_action(
+                    user=user_choice,
+                    feature=feature_choice,
+                    action=action_choice,
+                    parameters=parameters,
+                    execute_action=execute_action):
+                if event['event'] == 'decision':
+                    decision = event['decision']
+                    progress.info(f"🤖 [{feature_choice}] {action_choice} **{decision}** — explaining...")
+                elif event['event'] == 'reason':
+                    progress.info(f"🤖 [{feature_choice}] {action_choice} **{decision}**\n\n**Reason:** {event['text']}")
+                else:
+                    result = event['result']
+            progress.empty()
+            display_agentic_result(result, feature_choice, action_choice)
+        elif action_choice and parameters:
             with st.spinner("Evaluating rules with AI..."):
                 result = engine.evaluate_feature_action(
                     user=user_choice,
@@ -373,6 +1470,9 @@ def display_agentic_result(result: Dict[str, Any], feature: str, action: str):
     else:
         st.warning(f"⚠️ [{feature}] {action} **EVALUATION ERROR**")
         st.write(f"**Issue:** {result['reason']}")
+    
+    if result.get('decision_id'):
+        st.caption(f"Decision ID: {result['decision_id']} (explanation available in Action History)")
 
 def action_history_page(engine: AgenticRuleEngine):
     """Action history page"""
@@ -386,7 +1486,7 @@ def action_history_page(engine: AgenticRuleEngine):
     
     with col2:
         feature_filter = st.selectbox("Filter by Feature", 
-                                    ["All", "ATTENDANCE", "EXPENSE", "LEAVE", "PURCHASE"])
+                                    ["All"] + sorted(engine.get_available_features()))
     
     with col3:
         limit = st.number_input("Limit Results", min_value=10, max_value=200, value=50)
@@ -428,12 +1528,26 @@ def action_history_page(engine: AgenticRuleEngine):
                         row['Vendor'] = record['vendor']
                     if 'item' in record:
                         row['Item'] = record['item']
+                    if 'decision_id' in record:
+                        row['Decision ID'] = record['decision_id']
                     
                     df_data.append(row)
                 
                 st.dataframe(df_data, use_container_width=True)
         else:
             st.error(f"Failed to load history: {history[0].get('error', 'Unknown error')}")
+    
+    # Decision-first evaluations are explained on request
+    st.subheader("💬 Explain a Decision")
+    decision_id = st.text_input("Decision ID", placeholder="Decision ID from an evaluation result or the history")
+    if st.button("💬 Explain") and decision_id:
+        with st.spinner("Generating explanation..."):
+            explanation = engine.get_explanation(decision_id.strip())
+        if explanation['success']:
+            st.info(f"**{explanation['decision']}** [{explanation['feature']}] {explanation['action']}: "
+                    f"{explanation['explanation']}")
+        else:
+            st.error(explanation['message'])
 
 def rule_management_page(engine: AgenticRuleEngine):
     """Rule management interface"""
@@ -568,18 +1682,11 @@ def analytics_page(engine: AgenticRuleEngine):
     
     # Feature distribution
     st.subheader("🎯 Feature Distribution")
-    features = engine.get_available_features()
-    if features:
-        feature_counts = {}
-        for rule_set in engine.data['rule_sets'].values():
-            for rule in rule_set['rules']:
-                feature_matches = re.findall(r'\[([A-Z_]+)\]', rule)
-                for feature in feature_matches:
-                    feature_counts[feature] = feature_counts.get(feature, 0) + 1
-        
-        if feature_counts:
-            for feature, count in feature_counts.items():
-                st.write(f"• [{feature}]: {count} rules")
+    tag_index = engine.snapshot.tag_index
+    for feature in tag_index.feature_names():
+        actions = tag_index.actions_for(feature)
+        st.write(f"• [{feature}]: {len(tag_index.rules_for(feature))} rules"
+                 + (f" ({', '.join(actions)})" if actions else ""))
     
     # Rule complexity analysis
     st.subheader("🧠 Rule Complexity Analysis")
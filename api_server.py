@@ -0,0 +1,101 @@
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from typing import Dict, List, Any, Optional
+
+import uvicorn
+from fastapi import FastAPI
+from pydantic import BaseModel, Field
+
+from agentic_rule_engine import AgenticRuleEngine, FAST_EVALUATOR_MODEL
+from llm_transport import LLMTransport
+
+# One long-lived engine per worker process, created at startup
+engine: Optional[AgenticRuleEngine] = None
+
+
+class EvaluationRequest(BaseModel):
+    user: str
+    feature: str
+    action: str
+    parameters: Dict[str, Any] = Field(default_factory=dict)
+    rule_set_id: Optional[str] = None
+    execute_action: bool = True
+
+
+class BatchEvaluationRequest(BaseModel):
+    requests: List[EvaluationRequest]
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global engine
+    engine = AgenticRuleEngine(
+        rules_file=os.getenv('AGENTIC_RULES_FILE', 'agentic_rules.json'),
+        max_concurrency=int(os.getenv('AGENTIC_MAX_CONCURRENCY', '64')),
+        structured_output=os.getenv('AGENTIC_STRUCTURED_OUTPUT', '').lower() in ('1', 'true', 'yes'),
+        # Set AGENTIC_FAST_MODEL to an empty string to send every decision to the strong model
+        fast_model=os.getenv('AGENTIC_FAST_MODEL', FAST_EVALUATOR_MODEL),
+        # Decide with a short call and generate reasons later (GET /explanations/{decision_id})
+        decision_first=os.getenv('AGENTIC_DECISION_FIRST', '').lower() in ('1', 'true', 'yes'),
+        explain_in_background=os.getenv('AGENTIC_EXPLAIN_IN_BACKGROUND', '').lower() in ('1', 'true', 'yes'),
+        transport=LLMTransport(
+            max_retries=int(os.getenv('AGENTIC_LLM_RETRIES', '2')),
+            # Send a duplicate request when a call is slower than the observed p95
+            hedge=os.getenv('AGENTIC_HEDGE_REQUESTS', '').lower() in ('1', 'true', 'yes')
+        )
+    )
+    # Edits to the rules file take effect without restarting workers
+    engine.start_watching(float(os.getenv('AGENTIC_WATCH_INTERVAL', '1.0')))
+    yield
+    engine.stop_watching()
+    engine.action_executor.close()
+
+
+app = FastAPI(title="Agentic Rule Engine", lifespan=lifespan)
+
+
+@app.post("/evaluate")
+async def evaluate(request: EvaluationRequest) -> Dict[str, Any]:
+    """Evaluate one feature action and execute it if allowed"""
+    return await engine.aevaluate_feature_action(
+        user=request.user,
+        feature=request.feature,
+        action=request.action,
+        parameters=request.parameters,
+        rule_set_id=request.rule_set_id,
+        execute_action=request.execute_action
+    )
+
+
+@app.post("/evaluate/batch")
+async def evaluate_batch(batch: BatchEvaluationRequest) -> Dict[str, Any]:
+    """Evaluate many feature actions, sharing LLM calls between requests on the same rule set"""
+    requests = [request.model_dump() for request in batch.requests]
+    results = await asyncio.to_thread(engine.evaluate_batch, requests)
+    return {"results": results}
+
+
+@app.get("/history")
+async def history(user: Optional[str] = None, feature: Optional[str] = None,
+                  limit: int = 50, before: Optional[str] = None) -> Dict[str, Any]:
+    """Action history, newest first; pass `next_before` as `before` for the next page"""
+    records = await asyncio.to_thread(
+        engine.action_executor.get_action_history, user=user, feature=feature, limit=limit, before=before)
+    next_before = records[-1]['cursor'] if records and 'cursor' in records[-1] else None
+    return {"history": records, "next_before": next_before}
+
+
+@app.get("/explanations/{decision_id}")
+async def explanation(decision_id: str) -> Dict[str, Any]:
+    """Reason for a decision-first evaluation, generated on first request"""
+    return await asyncio.to_thread(engine.get_explanation, decision_id)
+
+
+if __name__ == "__main__":
+    uvicorn.run(
+        "api_server:app",
+        host=os.getenv('AGENTIC_HOST', '0.0.0.0'),
+        port=int(os.getenv('AGENTIC_PORT', '8000')),
+        workers=int(os.getenv('AGENTIC_WORKERS', '1'))
+    )
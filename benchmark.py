@@ -0,0 +1,441 @@
+"""
+Benchmark harness for the agentic rule engine.
+
+Starts a local OpenAI-compatible stub server with a configurable latency
+distribution and canned responses, points the engine at it, and measures
+single, concurrent, batched and streamed evaluations plus ActionExecutor
+writes. No API key or network access is needed.
+
+    python benchmark.py --requests 200 --concurrency 32 --latency lognormal:300,0.4
+    python benchmark.py --scenarios single,streaming --token-ms 15
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import re
+import shutil
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Any, Callable
+
+from openai import OpenAI, AsyncOpenAI
+
+from action_executor import ActionExecutor
+from agentic_rule_engine import AgenticRuleEngine, FAST_EVALUATOR_MODEL
+from decision_cache import DecisionCache
+from llm_transport import LLMTransport
+
+# Rules that the rule compiler cannot decide, so every evaluation reaches the LLM stub
+BENCHMARK_RULES = {
+    "rule_sets": {
+        "rule_set_1": {
+            "name": "Benchmark Policy",
+            "rules": [
+                "[EXPENSE] can only be [APPROVE] by [FINANCE_MANAGER] role users.",
+                "[PURCHASE] can only be [APPROVE] if [VENDOR] is pre-approved.",
+                "[INVOICE] can only be [SUBMIT] if [DUE_DATE] is within 30 days.",
+                "[LEAVE] can only be [APPROVE] by [MANAGER] role users."
+            ]
+        }
+    },
+    "user_assignments": {"bench_user": "rule_set_1"},
+    "global_parameters": {},
+    "feature_definitions": {}
+}
+
+WORKLOAD = [
+    ("EXPENSE", "APPROVE", lambda i: {"AMOUNT": 100 + i, "FINANCE_MANAGER": "yes"}),
+    ("PURCHASE", "APPROVE", lambda i: {"VENDOR": f"Vendor {i}", "AMOUNT": 250 + i}),
+    ("INVOICE", "SUBMIT", lambda i: {"DUE_DATE": f"{10 + i % 20} days", "INVOICE_ID": f"INV-{i}"}),
+    ("LEAVE", "APPROVE", lambda i: {"MANAGER": "yes", "AMOUNT": 1 + i % 10, "REQUEST_ID": i}),
+]
+
+
+STUB_REASON = ("Stub evaluation of the applicable rules. The request was compared with each rule "
+               "of the user's rule set that names this feature and action.")
+
+
+def parse_latency(spec: str) -> Callable[[], float]:
+    """
+    Latency distribution in milliseconds, returned as a sampler of seconds:
+    fixed:MS, uniform:LOW,HIGH or lognormal:MEDIAN,SIGMA
+    """
+    kind, _, args = spec.partition(':')
+    values = [float(value) for value in args.split(',') if value]
+    if kind == 'fixed':
+        return lambda: values[0] / 1000
+    if kind == 'uniform':
+        return lambda: random.uniform(values[0], values[1]) / 1000
+    if kind == 'lognormal':
+        return lambda: random.lognormvariate(math.log(values[0]), values[1]) / 1000
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token)"""
+    return max(1, math.ceil(len(text) / 4))
+
+
+class _StubHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # The default backlog of 5 makes concurrent clients wait on TCP retransmits
+    request_queue_size = 1024
+
+
+class StubLLMServer:
+    """OpenAI-compatible /v1/chat/completions endpoint with canned rule evaluation answers"""
+
+    def __init__(self, latency: Callable[[], float], deny_rate: float = 0.2, confidence: float = 0.95,
+                 token_ms: float = 0.0, error_rate: float = 0.0):
+        # latency is the time to the first token; token_ms is added per generated token
+        self.latency = latency
+        self.token_ms = token_ms
+        # Share of requests answered with a 503, to exercise retries
+        self.error_rate = error_rate
+        self.deny_rate = deny_rate
+        self.confidence = confidence
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                try:
+                    self.respond()
+                except (BrokenPipeError, ConnectionResetError, json.JSONDecodeError):
+                    # The engine drops fast-tier streams it escalates and hedged requests it no longer needs
+                    self.close_connection = True
+
+            def respond(self):
+                body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+                time.sleep(stub.latency())
+                if random.random() < stub.error_rate:
+                    payload = json.dumps({"error": {"message": "Stub overloaded", "type": "server_error"}}).encode('utf-8')
+                    self.send_response(503)
+                    self.send_header('Content-Type', 'application/json')
+                    self.send_header('Content-Length', str(len(payload)))
+                    self.end_headers()
+                    self.wfile.write(payload)
+                    return
+                completion = stub.complete(body)
+                if body.get('stream'):
+                    self.stream(completion)
+                    return
+                time.sleep(completion['usage']['completion_tokens'] * stub.token_ms / 1000)
+                payload = json.dumps(completion).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def stream(self, completion):
+                """Send the completion as server-sent events, one token-sized chunk at a time"""
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.end_headers()
+                content = completion['choices'][0]['message']['content']
+                for start in range(0, len(content), 4):
+                    if start:
+                        time.sleep(stub.token_ms / 1000)
+                    chunk = {"id": completion['id'], "object": "chat.completion.chunk",
+                             "created": completion['created'], "model": completion['model'],
+                             "choices": [{"index": 0, "delta": {"content": content[start:start + 4]},
+                                          "finish_reason": None}]}
+                    self.write_chunk(f"data: {json.dumps(chunk)}\n\n")
+                self.write_chunk("data: [DONE]\n\n")
+                self.wfile.write(b"0\r\n\r\n")
+
+            def write_chunk(self, text: str):
+                data = text.encode('utf-8')
+                self.wfile.write(f"{len(data):x}\r\n".encode('ascii') + data + b"\r\n")
+                self.wfile.flush()
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = _StubHTTPServer(('127.0.0.1', 0), Handler)
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}/v1"
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def reset_stats(self):
+        with self._lock:
+            self.calls = 0
+            self.prompt_tokens = 0
+            self.completion_tokens = 0
+
+    def decide(self, text: str) -> str:
+        # Deterministic per request text so repeated runs give the same answers
+        return 'DENIED' if random.Random(text).random() < self.deny_rate else 'ALLOWED'
+
+    def answer(self, decision: str, structured: bool, decision_only: bool = False,
+               confidence_line: bool = False) -> str:
+        if confidence_line:
+            # Batched prompts of a tiered engine ask for a Confidence line after each answer
+            return self.answer(decision, structured, decision_only) + f"\nConfidence: {self.confidence}"
+        if decision_only:
+            if structured:
+                return json.dumps({"decision": decision, "confidence_score": self.confidence, "rule_number": 1})
+            return f"Decision: {decision}\nRule: 1"
+        if structured:
+            return json.dumps({
+                "decision": decision,
+                "confidence_score": self.confidence,
+                "reason": STUB_REASON,
+                "rule_violated": "Stub rule" if decision == 'DENIED' else None
+            })
+        return (f"Decision: {decision}\n"
+                f"Reason: {STUB_REASON}\n"
+                f"Rule Violated: {'Stub rule' if decision == 'DENIED' else 'None'}")
+
+    def complete(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        prompt = "\n".join(message.get('content') or '' for message in body.get('messages', []))
+        response_format = body.get('response_format') or {}
+        structured = response_format.get('type') == 'json_schema'
+        decision_only = (response_format.get('json_schema', {}).get('name') == 'rule_decision'
+                         or 'Rule: [Number of the rule' in prompt)
+        blocks = re.split(r'^Request (\d+):$', prompt, flags=re.MULTILINE)
+        if len(blocks) > 1:
+            confidence_line = 'Confidence: [' in prompt
+            content = "\n\n".join(f"Request {number}:\n"
+                                  + self.answer(self.decide(block), False, decision_only, confidence_line)
+                                  for number, block in zip(blocks[1::2], blocks[2::2]))
+        else:
+            content = self.answer(self.decide(prompt), structured, decision_only)
+
+        usage = {"prompt_tokens": estimate_tokens(prompt), "completion_tokens": estimate_tokens(content)}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        with self._lock:
+            self.calls += 1
+            self.prompt_tokens += usage["prompt_tokens"]
+            self.completion_tokens += usage["completion_tokens"]
+
+        return {
+            "id": f"chatcmpl-stub-{self.calls}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get('model', 'stub'),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": usage
+        }
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile"""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def report(name: str, latencies: List[float], elapsed: float, decisions: int, stub: StubLLMServer = None) -> Dict[str, Any]:
+    """Summarize one scenario"""
+    result = {
+        "scenario": name,
+        "operations": len(latencies),
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "throughput_per_s": decisions / elapsed if elapsed else 0.0,
+        "llm_calls": stub.calls if stub else 0,
+        "tokens_per_decision": (stub.prompt_tokens + stub.completion_tokens) / decisions if stub and decisions else 0.0
+    }
+    print(f"{name:<20} {result['operations']:>6} {result['p50_ms']:>9.1f} {result['p95_ms']:>9.1f} "
+          f"{result['p99_ms']:>9.1f} {result['throughput_per_s']:>10.1f} {result['llm_calls']:>9} "
+          f"{result['tokens_per_decision']:>10.1f}")
+    return result
+
+
+def workload_request(index: int) -> Dict[str, Any]:
+    feature, action, parameters = WORKLOAD[index % len(WORKLOAD)]
+    return {"user": "bench_user", "feature": feature, "action": action,
+            "parameters": parameters(index), "execute_action": False}
+
+
+def bench_single(engine: AgenticRuleEngine, requests: int) -> tuple:
+    latencies = []
+    started = time.perf_counter()
+    for index in range(requests):
+        request = workload_request(index)
+        begin = time.perf_counter()
+        engine.evaluate_feature_action(request['user'], request['feature'], request['action'],
+                                       request['parameters'], execute_action=False)
+        latencies.append(time.perf_counter() - begin)
+    return latencies, time.perf_counter() - started, requests
+
+
+def bench_concurrent(engine: AgenticRuleEngine, requests: int, concurrency: int) -> tuple:
+    async def run():
+        gate = asyncio.Semaphore(concurrency)
+        latencies = []
+
+        async def one(index):
+            request = workload_request(index)
+            async with gate:
+                begin = time.perf_counter()
+                await engine.aevaluate_feature_action(request['user'], request['feature'], request['action'],
+                                                      request['parameters'], execute_action=False)
+                latencies.append(time.perf_counter() - begin)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(index) for index in range(requests)))
+        return latencies, time.perf_counter() - started, requests
+
+    return asyncio.run(run())
+
+
+def bench_batch(engine: AgenticRuleEngine, requests: int, batch_size: int) -> tuple:
+    latencies = []
+    started = time.perf_counter()
+    for start in range(0, requests, batch_size):
+        batch = [workload_request(index) for index in range(start, min(start + batch_size, requests))]
+        begin = time.perf_counter()
+        engine.evaluate_batch(batch, batch_size=batch_size)
+        latencies.append(time.perf_counter() - begin)
+    return latencies, time.perf_counter() - started, requests
+
+
+def bench_streaming(engine: AgenticRuleEngine, requests: int) -> tuple:
+    """Sequential streamed evaluations: time to the decision event and to the full result"""
+    to_decision = []
+    to_result = []
+    started = time.perf_counter()
+    for index in range(requests):
+        request = workload_request(index)
+        begin = time.perf_counter()
+        for event in engine.stream_feature_action(request['user'], request['feature'], request['action'],
+                                                  request['parameters'], execute_action=False):
+            if event['event'] == 'decision':
+                to_decision.append(time.perf_counter() - begin)
+        to_result.append(time.perf_counter() - begin)
+    return to_decision, to_result, time.perf_counter() - started, requests
+
+
+def bench_writes(db_file: str, requests: int, buffered: bool) -> tuple:
+    executor = ActionExecutor(db_file=db_file, buffered=buffered)
+    evaluation = {"decision": "ALLOWED", "reason": "benchmark", "rule_violated": None}
+    latencies = []
+    started = time.perf_counter()
+    if buffered:
+        # Many writers in flight at once, as under concurrent request handling
+        submitted = []
+        for index in range(requests):
+            begin = time.perf_counter()
+            future = executor.submit_action("bench_user", "EXPENSE", "SUBMIT",
+                                            {"AMOUNT": index, "CATEGORY": "Travel"}, evaluation)
+            future.add_done_callback(lambda _, begin=begin: latencies.append(time.perf_counter() - begin))
+            submitted.append(future)
+        for future in submitted:
+            future.result()
+    else:
+        for index in range(requests):
+            begin = time.perf_counter()
+            executor.execute_action("bench_user", "EXPENSE", "SUBMIT",
+                                    {"AMOUNT": index, "CATEGORY": "Travel"}, evaluation)
+            latencies.append(time.perf_counter() - begin)
+    elapsed = time.perf_counter() - started
+    executor.close()
+    return latencies, elapsed, requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the agentic rule engine against a local LLM stub")
+    parser.add_argument('--requests', type=int, default=200, help="evaluations (or writes) per scenario")
+    parser.add_argument('--concurrency', type=int, default=32, help="in-flight requests for the concurrent scenario")
+    parser.add_argument('--batch-size', type=int, default=20, help="requests per evaluate_batch call")
+    parser.add_argument('--latency', default='lognormal:300,0.4',
+                        help="stub latency: fixed:MS, uniform:LOW,HIGH or lognormal:MEDIAN,SIGMA")
+    parser.add_argument('--token-ms', type=float, default=0.0,
+                        help="stub generation time per completion token, in milliseconds")
+    parser.add_argument('--deny-rate', type=float, default=0.2, help="share of DENIED answers from the stub")
+    parser.add_argument('--structured', action='store_true', help="use JSON-schema structured output")
+    parser.add_argument('--confidence', type=float, default=0.95,
+                        help="confidence score in stub answers; below the escalation threshold every decision escalates")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="share of stub requests failing with HTTP 503")
+    parser.add_argument('--hedge', action='store_true',
+                        help="send a duplicate request once a call exceeds the observed p95 latency")
+    parser.add_argument('--decision-first', action='store_true',
+                        help="ask for the decision and rule number only; reasons are generated on demand")
+    parser.add_argument('--single-tier', action='store_true', help="send every decision to the strong model")
+    parser.add_argument('--scenarios', default='single,concurrent,batch,streaming,writes,writes-buffered')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', dest='json_file', help="also write the results to this JSON file")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    stub = StubLLMServer(parse_latency(args.latency), deny_rate=args.deny_rate, confidence=args.confidence,
+                         token_ms=args.token_ms, error_rate=args.error_rate)
+    stub.start()
+    workdir = tempfile.mkdtemp(prefix='agentic-bench-')
+    try:
+        rules_file = os.path.join(workdir, 'rules.json')
+        with open(rules_file, 'w') as file:
+            json.dump(BENCHMARK_RULES, file)
+
+        def new_engine() -> AgenticRuleEngine:
+            # A fresh engine and no decision cache, so every scenario measures real LLM calls
+            return AgenticRuleEngine(
+                rules_file,
+                decision_cache=DecisionCache(max_entries=0),
+                max_concurrency=args.concurrency,
+                structured_output=args.structured,
+                fast_model=None if args.single_tier else FAST_EVALUATOR_MODEL,
+                decision_first=args.decision_first,
+                transport=LLMTransport(hedge=args.hedge),
+                client=OpenAI(base_url=stub.base_url, api_key='benchmark', max_retries=0),
+                async_client=AsyncOpenAI(base_url=stub.base_url, api_key='benchmark', max_retries=0),
+                action_executor=ActionExecutor(db_file=os.path.join(workdir, 'engine_actions.db'))
+            )
+
+        print(f"latency={args.latency} token_ms={args.token_ms} requests={args.requests} concurrency={args.concurrency} "
+              f"batch_size={args.batch_size} hedge={args.hedge} error_rate={args.error_rate} decision_first={args.decision_first} structured={args.structured or not args.single_tier} tiered={not args.single_tier}")
+        print(f"{'scenario':<20} {'ops':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'decisions/s':>10} "
+              f"{'llm calls':>9} {'tokens/dec':>10}")
+
+        results = []
+        for scenario in args.scenarios.split(','):
+            stub.reset_stats()
+            engine = new_engine() if scenario in ('single', 'concurrent', 'batch', 'streaming') else None
+            if scenario == 'single':
+                results.append(report(scenario, *bench_single(engine, args.requests), stub))
+            elif scenario == 'concurrent':
+                results.append(report(scenario, *bench_concurrent(engine, args.requests, args.concurrency), stub))
+            elif scenario == 'batch':
+                results.append(report(scenario, *bench_batch(engine, args.requests, args.batch_size), stub))
+            elif scenario == 'streaming':
+                to_decision, to_result, elapsed, decisions = bench_streaming(engine, args.requests)
+                results.append(report('streaming-decision', to_decision, elapsed, decisions, stub))
+                results.append(report('streaming-result', to_result, elapsed, decisions, stub))
+            elif scenario == 'writes':
+                results.append(report(scenario, *bench_writes(os.path.join(workdir, 'writes.db'), args.requests, False)))
+            elif scenario == 'writes-buffered':
+                results.append(report(scenario, *bench_writes(os.path.join(workdir, 'writes_buffered.db'), args.requests, True)))
+            else:
+                raise SystemExit(f"Unknown scenario: {scenario}")
+            if engine is not None:
+                results[-1]["transport"] = dict(engine.transport.stats)
+                if args.hedge or args.error_rate:
+                    print(f"{'':<20} transport: {engine.transport.stats}")
+
+        if args.json_file:
+            with open(args.json_file, 'w') as file:
+                json.dump(results, file, indent=4)
+    finally:
+        stub.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
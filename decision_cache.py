@@ -0,0 +1,225 @@
+import json
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, date, time as dt_time
+from typing import Dict, Any, Optional, Iterable
+
+# Only definitive decisions are worth remembering; ERROR/UNKNOWN results are retried.
+CACHEABLE_DECISIONS = ('ALLOWED', 'DENIED')
+
+
+def canonicalize_value(value: Any) -> Any:
+    """Convert a parameter value into a stable, JSON-serialisable form"""
+    if isinstance(value, (datetime, date, dt_time)):
+        return value.isoformat()
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, str):
+        return value.strip()
+    if isinstance(value, dict):
+        return {str(k): canonicalize_value(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [canonicalize_value(v) for v in value]
+    if value is None or isinstance(value, (bool, int)):
+        return value
+    return str(value)
+
+
+def rule_set_digest(rule_set: Dict[str, Any]) -> str:
+    """Hash of the rule text of a rule set (the name does not affect decisions)"""
+    payload = json.dumps(rule_set.get('rules', []), separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def decision_key(rules_digest: str, feature: str, action: str, parameters: Dict[str, Any]) -> str:
+    """Content-addressed key for a single evaluation context"""
+    payload = json.dumps({
+        "rules": rules_digest,
+        "feature": feature.strip().upper(),
+        "action": action.strip().upper(),
+        "parameters": canonicalize_value(parameters)
+    }, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class DecisionCache:
+    """
+    LRU/TTL cache of rule evaluation results, keyed by a hash of the evaluation context.
+    Optionally persisted to SQLite so decisions survive restarts.
+    """
+
+    def __init__(self, max_entries: int = 10000, ttl_seconds: Optional[float] = 3600,
+                 db_file: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.db_file = db_file
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        # rule set digest -> keys cached for it, so changed rule sets are dropped without a scan
+        self._keys_by_digest: Dict[str, set] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if self.db_file:
+            self.init_database()
+
+    def init_database(self):
+        """Initialize SQLite table for persisted decisions"""
+        conn = sqlite3.connect(self.db_file)
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS decision_cache (
+                cache_key TEXT PRIMARY KEY,
+                rule_set_digest TEXT,
+                result TEXT,
+                created_at REAL
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_decision_cache_digest ON decision_cache (rule_set_digest)')
+        conn.commit()
+        conn.close()
+
+    def _expired(self, created_at: float) -> bool:
+        return self.ttl_seconds is not None and time.time() - created_at > self.ttl_seconds
+
+    def get(self, key: str, count: bool = True) -> Optional[Dict[str, Any]]:
+        """
+        Return a cached result, or None if missing or expired.
+
+        count=False leaves the hit/miss statistics alone, for a repeated lookup
+        of a key whose miss was already counted.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                digest, result, created_at = entry
+                if not self._expired(created_at):
+                    self._entries.move_to_end(key)
+                    if count:
+                        self.hits += 1
+                    return dict(result)
+                self._forget(key)
+
+        if self.db_file:
+            result = self._get_persisted(key, count)
+            if result is not None:
+                return result
+
+        if count:
+            with self._lock:
+                self.misses += 1
+        return None
+
+    def _get_persisted(self, key: str, count: bool = True) -> Optional[Dict[str, Any]]:
+        try:
+            conn = sqlite3.connect(self.db_file)
+            row = conn.execute(
+                'SELECT rule_set_digest, result, created_at FROM decision_cache WHERE cache_key = ?', (key,)
+            ).fetchone()
+            conn.close()
+        except sqlite3.Error:
+            return None
+
+        if row is None or self._expired(row[2]):
+            return None
+
+        digest, result_json, created_at = row
+        result = json.loads(result_json)
+        with self._lock:
+            self._remember(key, digest, result, created_at)
+            if count:
+                self.hits += 1
+        return dict(result)
+
+    def _remember(self, key: str, digest: str, result: Dict[str, Any], created_at: float):
+        if key in self._entries:
+            self._forget(key)
+        self._entries[key] = (digest, result, created_at)
+        self._keys_by_digest.setdefault(digest, set()).add(key)
+        while len(self._entries) > self.max_entries:
+            self._forget(next(iter(self._entries)))
+
+    def _forget(self, key: str):
+        digest = self._entries.pop(key)[0]
+        keys = self._keys_by_digest.get(digest)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_digest[digest]
+
+    def put(self, key: str, rules_digest: str, result: Dict[str, Any]):
+        """Store an evaluation result if it is a definitive decision"""
+        if result.get('decision') not in CACHEABLE_DECISIONS:
+            return
+
+        result = dict(result)
+        created_at = time.time()
+        with self._lock:
+            self._remember(key, rules_digest, result, created_at)
+
+        if self.db_file:
+            try:
+                conn = sqlite3.connect(self.db_file)
+                conn.execute(
+                    'INSERT OR REPLACE INTO decision_cache (cache_key, rule_set_digest, result, created_at) VALUES (?, ?, ?, ?)',
+                    (key, rules_digest, json.dumps(result, default=str), created_at)
+                )
+                conn.commit()
+                conn.close()
+            except sqlite3.Error:
+                pass
+
+    def retain_rule_sets(self, live_digests: Iterable[str]):
+        """Drop every entry whose rule text is no longer in use"""
+        live = set(live_digests)
+        with self._lock:
+            for digest in [d for d in self._keys_by_digest if d not in live]:
+                for key in list(self._keys_by_digest[digest]):
+                    self._forget(key)
+
+        if self.db_file:
+            try:
+                conn = sqlite3.connect(self.db_file)
+                if live:
+                    placeholders = ', '.join('?' for _ in live)
+                    conn.execute(f'DELETE FROM decision_cache WHERE rule_set_digest NOT IN ({placeholders})', list(live))
+                else:
+                    conn.execute('DELETE FROM decision_cache')
+                conn.commit()
+                conn.close()
+            except sqlite3.Error:
+                pass
+
+    def invalidate_rule_sets(self, digests: Iterable[str]):
+        """Drop the entries of specific rule set versions, leaving all others cached"""
+        digests = set(digests)
+        if not digests:
+            return
+        with self._lock:
+            for digest in digests:
+                for key in list(self._keys_by_digest.get(digest, ())):
+                    self._forget(key)
+
+        if self.db_file:
+            try:
+                conn = sqlite3.connect(self.db_file)
+                conn.executemany('DELETE FROM decision_cache WHERE rule_set_digest = ?',
+                                 [(digest,) for digest in digests])
+                conn.commit()
+                conn.close()
+            except sqlite3.Error:
+                pass
+
+    def clear(self):
+        """Remove all cached decisions"""
+        self.retain_rule_sets([])
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters for monitoring"""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses
+            }
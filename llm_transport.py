@@ -0,0 +1,289 @@
+import asyncio
+import math
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Dict, Any, Optional, Callable, Awaitable
+
+import openai
+
+# HTTP statuses worth retrying: request timeout, conflict, rate limit and server errors
+RETRYABLE_STATUS_CODES = (408, 409, 429)
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Whether an LLM call that failed with this error may succeed when repeated"""
+    if isinstance(error, (openai.APIConnectionError, TimeoutError, asyncio.TimeoutError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in RETRYABLE_STATUS_CODES or error.status_code >= 500
+    return False
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the provider while the circuit breaker is open"""
+
+
+class CircuitBreaker:
+    """
+    Fails fast while the LLM provider is unhealthy.
+
+    After failure_threshold consecutive retryable failures the circuit opens and
+    calls are rejected for reset_timeout seconds; then one probe call is let
+    through (half-open) and its outcome closes or re-opens the circuit. A probe
+    that has not reported back after probe_timeout seconds is presumed lost and
+    another probe is let through.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0,
+                 probe_timeout: Optional[float] = None):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.probe_timeout = reset_timeout if probe_timeout is None else probe_timeout
+        self._lock = threading.Lock()
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probe_started: Optional[float] = None
+
+    @property
+    def state(self) -> str:
+        """'closed', 'open' or 'half-open'"""
+        with self._lock:
+            if self.opened_at is None:
+                return 'closed'
+            return 'half-open' if time.monotonic() - self.opened_at >= self.reset_timeout else 'open'
+
+    def allow(self) -> bool:
+        """Whether a call may go to the provider now"""
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            now = time.monotonic()
+            if now - self.opened_at < self.reset_timeout:
+                return False
+            if self._probe_started is not None and now - self._probe_started < self.probe_timeout:
+                return False
+            self._probe_started = now
+            return True
+
+    def retry_after(self) -> float:
+        """Seconds until the open circuit lets a probe call through"""
+        with self._lock:
+            if self.opened_at is None:
+                return 0.0
+            return max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._probe_started = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._probe_started is not None or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self._probe_started = None
+
+
+class LatencyTracker:
+    """Recent call latencies per model, used to decide when to hedge"""
+
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        self.window = window
+        self.min_samples = min_samples
+        self._lock = threading.Lock()
+        self._samples: Dict[str, deque] = {}
+
+    def record(self, key: str, seconds: float):
+        with self._lock:
+            self._samples.setdefault(key, deque(maxlen=self.window)).append(seconds)
+
+    def quantile(self, key: str, fraction: float) -> Optional[float]:
+        """Nearest-rank quantile, or None until enough calls were observed"""
+        with self._lock:
+            samples = sorted(self._samples.get(key, ()))
+        if len(samples) < self.min_samples:
+            return None
+        return samples[max(0, math.ceil(fraction * len(samples)) - 1)]
+
+
+class LLMTransport:
+    """
+    Runs LLM calls with retries, a circuit breaker and optional hedging.
+
+    Retryable errors (connection problems, timeouts, 408/409/429 and 5xx) are
+    retried with jittered exponential backoff. With hedge=True a duplicate request
+    is sent once a call has taken longer than the observed hedge_quantile (p95)
+    latency for its model, and whichever answers first is used. In call() the
+    original request runs on a thread of its own and only duplicates use the pool.
+
+    call() takes a function that performs one request; acall() takes a function
+    returning a coroutine, so every attempt is a fresh request.
+    """
+
+    def __init__(self, max_retries: int = 2, base_delay: float = 0.25, max_delay: float = 4.0,
+                 breaker: Optional[CircuitBreaker] = None, hedge: bool = False,
+                 hedge_quantile: float = 0.95, min_hedge_delay: float = 0.05,
+                 latency: Optional[LatencyTracker] = None, max_hedge_workers: int = 32):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.breaker = breaker if breaker is not None else CircuitBreaker()
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.min_hedge_delay = min_hedge_delay
+        self.latency = latency if latency is not None else LatencyTracker()
+        self.max_hedge_workers = max_hedge_workers
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._pool_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.stats = {"calls": 0, "retries": 0, "hedges": 0, "hedge_wins": 0, "rejected": 0}
+
+    def count(self, name: str):
+        with self._stats_lock:
+            self.stats[name] += 1
+
+    def backoff(self, attempt: int) -> float:
+        """Full-jitter exponential backoff before retry number attempt + 1"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def hedge_delay(self, key: str) -> Optional[float]:
+        """How long to wait before sending a duplicate request, or None to not hedge"""
+        if not self.hedge:
+            return None
+        observed = self.latency.quantile(key, self.hedge_quantile)
+        return None if observed is None else max(observed, self.min_hedge_delay)
+
+    def check_circuit(self):
+        if not self.breaker.allow():
+            self.count("rejected")
+            raise CircuitOpenError(
+                f"LLM provider unavailable, circuit open (retry in {self.breaker.retry_after():.0f}s)")
+
+    def call(self, fn: Callable[[], Any], key: str = 'default', hedge: bool = True) -> Any:
+        """Run one LLM request with retries; hedge=False for calls that must not be duplicated (streams)"""
+        self.count("calls")
+        for attempt in range(self.max_retries + 1):
+            self.check_circuit()
+            try:
+                delay = self.hedge_delay(key) if hedge else None
+                result = self._timed(fn, key) if delay is None else self._hedged(fn, key, delay)
+            except Exception as e:
+                if not is_retryable(e):
+                    # The provider answered; a bad request says nothing about its health
+                    self.breaker.record_success()
+                    raise
+                self.breaker.record_failure()
+                if attempt == self.max_retries:
+                    raise
+                self.count("retries")
+                time.sleep(self.backoff(attempt))
+                continue
+            except BaseException:
+                # An interrupted call never answered; counting it as a failure also ends a probe
+                self.breaker.record_failure()
+                raise
+            self.breaker.record_success()
+            return result
+
+    async def acall(self, fn: Callable[[], Awaitable[Any]], key: str = 'default', hedge: bool = True) -> Any:
+        """Async counterpart of call"""
+        self.count("calls")
+        for attempt in range(self.max_retries + 1):
+            self.check_circuit()
+            try:
+                delay = self.hedge_delay(key) if hedge else None
+                result = await (self._atimed(fn, key) if delay is None else self._ahedged(fn, key, delay))
+            except Exception as e:
+                if not is_retryable(e):
+                    self.breaker.record_success()
+                    raise
+                self.breaker.record_failure()
+                if attempt == self.max_retries:
+                    raise
+                self.count("retries")
+                await asyncio.sleep(self.backoff(attempt))
+                continue
+            except BaseException:
+                # Cancelled, e.g. by asyncio.wait_for; count it as a failure so a probe is not left open
+                self.breaker.record_failure()
+                raise
+            self.breaker.record_success()
+            return result
+
+    def _timed(self, fn: Callable[[], Any], key: str) -> Any:
+        started = time.monotonic()
+        result = fn()
+        self.latency.record(key, time.monotonic() - started)
+        return result
+
+    async def _atimed(self, fn: Callable[[], Awaitable[Any]], key: str) -> Any:
+        started = time.monotonic()
+        result = await fn()
+        self.latency.record(key, time.monotonic() - started)
+        return result
+
+    def _hedge_pool(self) -> ThreadPoolExecutor:
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.max_hedge_workers, thread_name_prefix="llm-hedge")
+            return self._pool
+
+    def _hedged(self, fn: Callable[[], Any], key: str, delay: float) -> Any:
+        # The original request gets its own thread so it never queues behind duplicates in the pool
+        primary: Future = Future()
+
+        def run_primary():
+            try:
+                primary.set_result(self._timed(fn, key))
+            except BaseException as e:
+                primary.set_exception(e)
+
+        threading.Thread(target=run_primary, name="llm-request", daemon=True).start()
+        done, _ = wait([primary], timeout=delay)
+        if done:
+            return primary.result()
+
+        self.count("hedges")
+        hedged = self._hedge_pool().submit(self._timed, fn, key)
+        pending = {primary, hedged}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is hedged:
+                        self.count("hedge_wins")
+                    # The slower request cannot be cancelled once sent; its answer is dropped
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    async def _ahedged(self, fn: Callable[[], Awaitable[Any]], key: str, delay: float) -> Any:
+        primary = asyncio.ensure_future(self._atimed(fn, key))
+        done, _ = await asyncio.wait([primary], timeout=delay)
+        if done:
+            return primary.result()
+
+        self.count("hedges")
+        hedged = asyncio.ensure_future(self._atimed(fn, key))
+        pending = {primary, hedged}
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedged:
+                            self.count("hedge_wins")
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            # Cancelling the slower request closes its connection
+            for task in pending:
+                task.cancel()
@@ -0,0 +1,334 @@
+import math
+import re
+from datetime import datetime, date, time as dt_time
+from typing import Dict, List, Any, Optional
+from rule_index import RuleSetIndex
+
+# Condition grammar of a compilable rule: "[FEATURE] can only be [ACTION] <conditions>."
+# Which rules relate to which feature/action comes from tag_index.tokenize_rule via RuleSetIndex.
+RULE_HEADER = re.compile(r'^\s*\[([A-Z][A-Z0-9_-]*)\]\s+can only be\s+\[([A-Z][A-Z0-9_-]*)\]\s*(.*?)\s*\.?\s*$')
+
+NUMBER = r'(-?\d+(?:,\d{3})*(?:\.\d+)?)'
+CLOCK = r'(\d{1,2}:\d{2})'
+
+NUMERIC_OPERATORS = {
+    'is less than or equal to': '<=',
+    'is greater than or equal to': '>=',
+    'is less than': '<',
+    'is under': '<',
+    'is below': '<',
+    'is greater than': '>',
+    'is more than': '>',
+    'is above': '>',
+    'is at most': '<=',
+    'does not exceed': '<=',
+    'is at least': '>=',
+}
+
+DAY_NAMES = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+DAY_GROUPS = {
+    'weekend': {5, 6},
+    'weekends': {5, 6},
+    'weekday': {0, 1, 2, 3, 4},
+    'weekdays': {0, 1, 2, 3, 4},
+}
+
+
+def _to_number(value: Any) -> Optional[float]:
+    if isinstance(value, bool):
+        return None
+    try:
+        if isinstance(value, (int, float)):
+            number = float(value)
+        else:
+            number = float(str(value).replace(',', '').replace('$', '').strip())
+    except (TypeError, ValueError):
+        return None
+    # NaN and infinite amounts cannot be compared meaningfully; leave them to the LLM
+    return number if math.isfinite(number) else None
+
+
+def _to_time(value: Any) -> Optional[dt_time]:
+    if isinstance(value, datetime):
+        return value.time()
+    if isinstance(value, dt_time):
+        return value
+    if isinstance(value, str):
+        for fmt in ('%H:%M', '%H:%M:%S', '%H:%M:%S.%f'):
+            try:
+                return datetime.strptime(value.strip(), fmt).time()
+            except ValueError:
+                continue
+    return None
+
+
+def _parse_clock(text: str) -> dt_time:
+    return datetime.strptime(text, '%H:%M').time()
+
+
+def _split_values(text: str) -> List[str]:
+    parts = re.split(r'\s*,\s*(?:or\s+|and\s+)?|\s+or\s+|\s+and\s+', text.strip())
+    return [part.strip().strip('"\'') for part in parts if part.strip()]
+
+
+class NumericThreshold:
+    """[PARAM] compared against a constant"""
+
+    def __init__(self, parameter: str, operator: str, limit: float):
+        self.parameter = parameter
+        self.operator = operator
+        self.limit = limit
+
+    def evaluate(self, parameters: Dict[str, Any]) -> Optional[bool]:
+        value = _to_number(parameters.get(self.parameter))
+        if value is None:
+            return None
+        if self.operator == '<':
+            return value < self.limit
+        if self.operator == '<=':
+            return value <= self.limit
+        if self.operator == '>':
+            return value > self.limit
+        return value >= self.limit
+
+    def describe(self, parameters: Dict[str, Any]) -> str:
+        return f"[{self.parameter}] {parameters.get(self.parameter)} must be {self.operator} {self.limit:g}"
+
+
+class TimeWindow:
+    """[TIME] after/before a clock time, or within a window (which may wrap midnight)"""
+
+    def __init__(self, parameter: str, start: Optional[dt_time] = None, end: Optional[dt_time] = None):
+        self.parameter = parameter
+        self.start = start
+        self.end = end
+
+    def evaluate(self, parameters: Dict[str, Any]) -> Optional[bool]:
+        value = _to_time(parameters.get(self.parameter))
+        if value is None:
+            return None
+        if self.start is not None and self.end is not None:
+            if self.start <= self.end:
+                return self.start <= value <= self.end
+            return value >= self.start or value <= self.end
+        if self.start is not None:
+            return value > self.start
+        return value < self.end
+
+    def describe(self, parameters: Dict[str, Any]) -> str:
+        value = parameters.get(self.parameter)
+        if self.start is not None and self.end is not None:
+            return f"[{self.parameter}] {value} must be between {self.start:%H:%M} and {self.end:%H:%M}"
+        if self.start is not None:
+            return f"[{self.parameter}] {value} must be after {self.start:%H:%M}"
+        return f"[{self.parameter}] {value} must be before {self.end:%H:%M}"
+
+
+class EnumMembership:
+    """[PARAM] must be one of an explicit list of values"""
+
+    def __init__(self, parameter: str, values: List[str]):
+        self.parameter = parameter
+        self.values = values
+        self._normalized = {value.lower() for value in values}
+
+    def evaluate(self, parameters: Dict[str, Any]) -> Optional[bool]:
+        value = parameters.get(self.parameter)
+        if value is None or str(value).strip() == '':
+            return None
+        return str(value).strip().lower() in self._normalized
+
+    def describe(self, parameters: Dict[str, Any]) -> str:
+        return f"[{self.parameter}] {parameters.get(self.parameter)} must be one of {', '.join(self.values)}"
+
+
+class DayOfWeek:
+    """[DAY] must fall on one of the given weekdays (0 = Monday)"""
+
+    def __init__(self, parameter: str, days: set, label: str):
+        self.parameter = parameter
+        self.days = days
+        self.label = label
+
+    def _weekday(self, parameters: Dict[str, Any]) -> Optional[int]:
+        value = parameters.get(self.parameter)
+        if value is None:
+            value = parameters.get('DATE')
+        if isinstance(value, (datetime, date)):
+            return value.weekday()
+        if isinstance(value, str):
+            name = value.strip().lower()
+            if name in DAY_NAMES:
+                return DAY_NAMES.index(name)
+            try:
+                return datetime.strptime(name, '%Y-%m-%d').weekday()
+            except ValueError:
+                return None
+        return None
+
+    def evaluate(self, parameters: Dict[str, Any]) -> Optional[bool]:
+        weekday = self._weekday(parameters)
+        if weekday is None:
+            return None
+        return weekday in self.days
+
+    def describe(self, parameters: Dict[str, Any]) -> str:
+        return f"[{self.parameter}] must be on {self.label}"
+
+
+def _numeric_condition(match) -> NumericThreshold:
+    return NumericThreshold(match.group(1), NUMERIC_OPERATORS[match.group(2)], float(match.group(3).replace(',', '')))
+
+
+def _day_condition(match) -> Optional[DayOfWeek]:
+    days = set()
+    for name in _split_values(match.group(2)):
+        name = name.lower()
+        if name in DAY_GROUPS:
+            days |= DAY_GROUPS[name]
+        elif name.rstrip('s') in DAY_NAMES:
+            days.add(DAY_NAMES.index(name.rstrip('s')))
+        else:
+            return None
+    return DayOfWeek(match.group(1), days, match.group(2).strip())
+
+
+_OPERATOR_PATTERN = '|'.join(re.escape(op) for op in sorted(NUMERIC_OPERATORS, key=len, reverse=True))
+
+# Each entry: (pattern anchored at the start of the remaining condition text, predicate factory)
+CONDITION_PATTERNS = [
+    (re.compile(rf'if \[([A-Z][A-Z0-9_-]*)\](?: \w+)? ({_OPERATOR_PATTERN}) \$?{NUMBER}(?: days| hours)?'),
+     _numeric_condition),
+    (re.compile(rf'(?:during|between) \[([A-Z][A-Z0-9_-]*)\] {CLOCK} (?:to|and) {CLOCK}'),
+     lambda m: TimeWindow(m.group(1), _parse_clock(m.group(2)), _parse_clock(m.group(3)))),
+    (re.compile(rf'after \[([A-Z][A-Z0-9_-]*)\] {CLOCK}'),
+     lambda m: TimeWindow(m.group(1), start=_parse_clock(m.group(2)))),
+    (re.compile(rf'before \[([A-Z][A-Z0-9_-]*)\] {CLOCK}'),
+     lambda m: TimeWindow(m.group(1), end=_parse_clock(m.group(2)))),
+    (re.compile(r'if \[([A-Z][A-Z0-9_-]*)\] is (?:one of|either|in) ([\w\s,\'"-]+?)(?=$| and (?:if|after|before|during|between|on) )'),
+     lambda m: EnumMembership(m.group(1), _split_values(m.group(2)))),
+    (re.compile(r'on \[([A-Z][A-Z0-9_-]*)\] ((?:weekends?|weekdays?|mondays?|tuesdays?|wednesdays?|thursdays?|fridays?|saturdays?|sundays?)'
+                r'(?:(?:,\s*|\s+or\s+|\s+and\s+)(?:weekends?|weekdays?|mondays?|tuesdays?|wednesdays?|thursdays?|fridays?|saturdays?|sundays?))*)',
+                re.IGNORECASE),
+     _day_condition),
+]
+
+
+class CompiledRule:
+    """A rule reduced to a conjunction of locally checkable predicates"""
+
+    def __init__(self, rule: str, feature: str, action: str, predicates: List[Any]):
+        self.rule = rule
+        self.feature = feature
+        self.action = action
+        self.predicates = predicates
+
+    def evaluate(self, parameters: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Return None if any predicate cannot be checked with the given parameters"""
+        for predicate in self.predicates:
+            outcome = predicate.evaluate(parameters)
+            if outcome is None:
+                return None
+            if not outcome:
+                return {"satisfied": False, "detail": predicate.describe(parameters)}
+        return {"satisfied": True, "detail": None}
+
+
+def compile_rule(rule: str) -> Optional[CompiledRule]:
+    """Compile a bracketed FPR rule into predicates, or return None if it needs the LLM"""
+    header = RULE_HEADER.match(rule)
+    if not header:
+        return None
+
+    feature, action, remaining = header.group(1), header.group(2), header.group(3)
+    predicates = []
+    while remaining:
+        for pattern, factory in CONDITION_PATTERNS:
+            match = pattern.match(remaining)
+            if match:
+                predicate = factory(match)
+                if predicate is None:
+                    return None
+                predicates.append(predicate)
+                remaining = remaining[match.end():].strip()
+                if remaining.startswith('and '):
+                    remaining = remaining[4:].strip()
+                break
+        else:
+            return None
+
+    if not predicates:
+        return None
+    return CompiledRule(rule, feature, action, predicates)
+
+
+class CompiledRuleSet:
+    """
+    Compiled view of one rule set. Decides locally when every rule that applies
+    to a feature/action was compiled, and defers to the LLM otherwise.
+    """
+
+    def __init__(self, rules: List[str], index: Optional[RuleSetIndex] = None):
+        index = index if index is not None else RuleSetIndex(rules)
+        self.compiled: List[CompiledRule] = []
+        self.uncompiled: List[str] = []
+        # Lookups built once, so evaluation does not rescan the rules. The LLM is needed
+        # when any rule RuleSetIndex.relevant_positions selects for a request is not a
+        # compiled rule of that exact feature/action.
+        self._applicable: Dict[tuple, List[CompiledRule]] = {}
+        # (feature, action) pairs with an uncompiled "[FEATURE] can (only) be [ACTION]" rule
+        self._llm_actions: set = set()
+        # Features with a relevant rule for every action: rules headed by the feature
+        # without an action, and rules of other features that mention it
+        self._llm_features: set = set()
+        # An untagged rule may apply to anything
+        self._llm_always = bool(index.global_positions)
+        for rule, (feature, action, parameters) in zip(rules, index.tokens):
+            compiled_rule = compile_rule(rule) if action is not None else None
+            if compiled_rule:
+                self.compiled.append(compiled_rule)
+                self._applicable.setdefault((compiled_rule.feature, compiled_rule.action), []).append(compiled_rule)
+            else:
+                self.uncompiled.append(rule)
+                if action is None:
+                    if feature is not None:
+                        self._llm_features.add(feature)
+                else:
+                    self._llm_actions.add((feature, action))
+            if feature is not None:
+                self._llm_features.update(tag for tag in [action] + parameters if tag and tag != feature)
+
+    def _needs_llm(self, feature: str, action: str) -> bool:
+        return self._llm_always or feature in self._llm_features or (feature, action) in self._llm_actions
+
+    def evaluate(self, feature: str, action: str, parameters: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Return a decision, or None if the LLM has to evaluate this request"""
+        feature = feature.strip().upper()
+        action = action.strip().upper()
+
+        applicable = self._applicable.get((feature, action))
+        if not applicable or self._needs_llm(feature, action):
+            return None
+
+        outcomes = []
+        for rule in applicable:
+            outcome = rule.evaluate(parameters)
+            if outcome is None:
+                return None
+            outcomes.append((rule, outcome))
+
+        for rule, outcome in outcomes:
+            if not outcome['satisfied']:
+                return {
+                    "decision": "DENIED",
+                    "reason": f"Rule '{rule.rule}' is not satisfied: {outcome['detail']}.",
+                    "rule_violated": rule.rule,
+                    "evaluated_by": "rule_compiler"
+                }
+
+        return {
+            "decision": "ALLOWED",
+            "reason": "All applicable rules are satisfied: " + " ".join(rule.rule for rule, _ in outcomes),
+            "rule_violated": None,
+            "evaluated_by": "rule_compiler"
+        }
@@ -0,0 +1,51 @@
+from typing import Dict, List, Optional, Tuple
+from tag_index import tokenize_rule, TokenizedRule
+
+
+class RuleSetIndex:
+    """
+    Index of one rule set by the bracketed tags its rules mention, used to send the
+    LLM only the rules relevant to a feature and action.
+    """
+
+    def __init__(self, rules: List[str], tokens: Optional[List[TokenizedRule]] = None):
+        self.rules = rules
+        # (feature, action, parameters) per rule, shared with the compiler and tag index
+        self.tokens = tokens if tokens is not None else [tokenize_rule(rule) for rule in rules]
+        # feature -> [(position, action or None)] for rules headed by that feature
+        self.by_feature: Dict[str, List[Tuple[int, Optional[str]]]] = {}
+        # tag -> positions of rules that mention the tag anywhere
+        self.by_tag: Dict[str, List[int]] = {}
+        # rules without tags, which may apply to anything
+        self.global_positions: List[int] = []
+
+        for position, (feature, action, parameters) in enumerate(self.tokens):
+            if feature is None:
+                self.global_positions.append(position)
+                continue
+            for tag in dict.fromkeys([feature] + ([action] if action else []) + parameters):
+                self.by_tag.setdefault(tag, []).append(position)
+            self.by_feature.setdefault(feature, []).append((position, action))
+
+    def relevant_rules(self, feature: str, action: str) -> List[str]:
+        """Rules that can affect a feature/action, in their original order"""
+        return [self.rules[position] for position in self.relevant_positions(feature, action)]
+
+    def relevant_positions(self, feature: str, action: str) -> Tuple[int, ...]:
+        """Positions of the rules that can affect a feature/action, in ascending order"""
+        feature = feature.strip().upper()
+        action = action.strip().upper()
+
+        positions = set(self.global_positions)
+        for position, rule_action in self.by_feature.get(feature, []):
+            # "[FEATURE] can only be [OTHER_ACTION] ..." does not constrain this action
+            if rule_action is None or rule_action == action:
+                positions.add(position)
+
+        headed = {position for position, _ in self.by_feature.get(feature, [])}
+        for position in self.by_tag.get(feature, []):
+            # The feature appears as a condition of another feature's rule
+            if position not in headed:
+                positions.add(position)
+
+        return tuple(sorted(positions))
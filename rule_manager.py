@@ -2,18 +2,19 @@ import streamlit as st
 import json
 from datetime import datetime
 import os
+from rule_store import open_rule_store, apply_assignments, iter_assignments
 
 class RuleManager:
-    def __init__(self, rules_file='rules.json'):
+    def __init__(self, rules_file='rules.json', rule_store=None):
         self.rules_file = rules_file
+        # Every mutation below is persisted through the store as it happens
+        self.rule_store = rule_store if rule_store is not None else open_rule_store(rules_file)
         self.load_rules()
     
     def load_rules(self):
-        """Load rules from JSON file"""
-        try:
-            with open(self.rules_file, 'r') as file:
-                self.data = json.load(file)
-        except FileNotFoundError:
+        """Load rules from the rule store"""
+        self.data = self.rule_store.load()
+        if self.data is None:
             self.data = {
                 "rule_sets": {},
                 "user_assignments": {},
@@ -21,9 +22,8 @@ class RuleManager:
             }
     
     def save_rules(self):
-        """Save rules to JSON file"""
-        with open(self.rules_file, 'w') as file:
-            json.dump(self.data, file, indent=4)
+        """Write the whole rules document to the rule store"""
+        self.rule_store.save(self.data)
     
     def add_rule_set(self, name, rules):
         """Add a new rule set"""
@@ -32,6 +32,7 @@ class RuleManager:
             "name": name,
             "rules": rules
         }
+        self.rule_store.put_rule_set(rule_set_id, self.data['rule_sets'][rule_set_id], self.data)
         return rule_set_id
     
     def update_rule_set(self, rule_set_id, name, rules):
@@ -41,6 +42,7 @@ class RuleManager:
                 "name": name,
                 "rules": rules
             }
+            self.rule_store.put_rule_set(rule_set_id, self.data['rule_sets'][rule_set_id], self.data)
             return True
         return False
     
@@ -55,6 +57,7 @@ class RuleManager:
                     users_to_remove.append(user)
             for user in users_to_remove:
                 del self.data['user_assignments'][user]
+            self.rule_store.delete_rule_set(rule_set_id, self.data)
             return True
         return False
     
@@ -62,8 +65,38 @@ class RuleManager:
         """Assign a user to a rule set"""
         if rule_set_id in self.data['rule_sets']:
             self.data['user_assignments'][user] = rule_set_id
+            self.rule_store.put_assignments({user: rule_set_id}, self.data)
+            return True
+        return False
+    
+    def assign_users_bulk(self, mapping):
+        """Assign many users at once, persisted in one write; nothing changes if a rule set id is unknown"""
+        data = dict(self.data)
+        data['user_assignments'] = dict(data['user_assignments'])
+        result = apply_assignments(self.rule_store, data, mapping)
+        if result['success']:
+            self.data = data
+        return result
+    
+    def assign_users_from_file(self, stream, file_format='csv'):
+        """Bulk-assign users from a CSV ("user,rule_set_id") or JSONL stream"""
+        try:
+            return self.assign_users_bulk(iter_assignments(stream, file_format))
+        except ValueError as e:
+            return {"success": False, "assigned": 0, "invalid_rule_sets": [], "message": f"❌ {e}"}
+    
+    def remove_user_assignment(self, user):
+        """Remove a user's rule set assignment"""
+        if user in self.data['user_assignments']:
+            del self.data['user_assignments'][user]
+            self.rule_store.delete_assignments([user], self.data)
             return True
         return False
+    
+    def set_project_location(self, location):
+        """Update the project location"""
+        self.data['project_location'] = location
+        self.rule_store.put_setting('project_location', location, self.data)
 
 def rule_management_interface():
     """Streamlit interface for rule management"""
@@ -140,7 +173,6 @@ def add_rule_set_page(rule_manager):
             rules = [rule.strip() for rule in rules_text.split('\n') if rule.strip()]
             if rules:
                 rule_set_id = rule_manager.add_rule_set(rule_set_name, rules)
-                rule_manager.save_rules()
                 st.success(f"✅ Rule set '{rule_set_name}' added successfully!")
                 st.info(f"Rule Set ID: {rule_set_id}")
             else:
@@ -176,7 +208,6 @@ def edit_rule_set_page(rule_manager):
                 new_rules = [rule.strip() for rule in new_rules_text.split('\n') if rule.strip()]
                 if new_rules:
                     rule_manager.update_rule_set(rule_set_id, new_name, new_rules)
-                    rule_manager.save_rules()
                     st.success("✅ Rule set updated successfully!")
                 else:
                     st.error("Please enter at least one rule.")
@@ -184,7 +215,6 @@ def edit_rule_set_page(rule_manager):
         with col2:
             if st.form_submit_button("🗑️ Delete Rule Set"):
                 if rule_manager.delete_rule_set(rule_set_id):
-                    rule_manager.save_rules()
                     st.success("✅ Rule set deleted successfully!")
                     st.rerun()
 
@@ -209,9 +239,19 @@ def manage_users_page(rule_manager):
         
         if st.form_submit_button("Assign User") and new_user and rule_set_id:
             rule_manager.assign_user_to_rule_set(new_user, rule_set_id)
-            rule_manager.save_rules()
             st.success(f"✅ User '{new_user}' assigned to rule set successfully!")
     
+    # Bulk assignment from an HR export
+    st.subheader("📥 Bulk Assign Users")
+    uploaded_file = st.file_uploader("Upload assignments (CSV: user,rule_set_id or JSONL)", type=['csv', 'jsonl'])
+    if uploaded_file is not None and st.button("📥 Assign Users"):
+        file_format = 'jsonl' if uploaded_file.name.endswith('.jsonl') else 'csv'
+        result = rule_manager.assign_users_from_file(uploaded_file, file_format)
+        if result['success']:
+            st.success(result['message'])
+        else:
+            st.error(result['message'])
+    
     # Remove user assignments
     st.subheader("🗑️ Remove User Assignments")
     if rule_manager.data['user_assignments']:
@@ -224,8 +264,7 @@ def manage_users_page(rule_manager):
             
             with col2:
                 if st.button(f"Remove {user}", key=f"remove_{user}"):
-                    del rule_manager.data['user_assignments'][user]
-                    rule_manager.save_rules()
+                    rule_manager.remove_user_assignment(user)
                     st.success(f"✅ User '{user}' assignment removed!")
                     st.rerun()
     else:
@@ -240,8 +279,7 @@ def settings_page(rule_manager):
     new_location = st.text_input("Project Location", value=current_location)
     
     if st.button("💾 Save Location"):
-        rule_manager.data['project_location'] = new_location
-        rule_manager.save_rules()
+        rule_manager.set_project_location(new_location)
         st.success("✅ Project location updated!")
     
     st.subheader("📊 System Information")
@@ -0,0 +1,136 @@
+import os
+import threading
+from typing import Dict, Any, Optional, Callable, Set
+from decision_cache import rule_set_digest
+from rule_compiler import CompiledRuleSet
+from rule_index import RuleSetIndex
+from tag_index import TagIndex
+
+try:
+    from watchdog.observers import Observer
+except ImportError:
+    Observer = None
+
+
+class RuleSnapshot:
+    """
+    One version of the rules document together with everything precompiled from it,
+    including the typed tag index behind the feature/parameter lists.
+
+    The rules and compiled artefacts of a snapshot are never modified after it is
+    published (only its prompt prefix memo fills up): reloading builds a new one and
+    swaps the engine's reference, so an evaluation that picked up the old snapshot
+    finishes against the old rules. Compiled rules, indexes and rendered prompt
+    prefixes are carried over from the previous snapshot for rule sets whose rule
+    text did not change.
+    """
+
+    def __init__(self, data: Dict[str, Any], previous: Optional['RuleSnapshot'] = None):
+        self.data = data
+        self.version = previous.version + 1 if previous else 1
+        self.rule_set_digests: Dict[str, str] = {}
+        self.compiled_rule_sets: Dict[str, CompiledRuleSet] = {}
+        self.rule_indexes: Dict[str, RuleSetIndex] = {}
+
+        # Only rule sets that were added, changed or removed are re-tokenized
+        self.tag_index = previous.tag_index.copy() if previous else TagIndex()
+        if previous:
+            for rule_set_id in previous.rule_set_digests:
+                if rule_set_id not in data['rule_sets']:
+                    self.tag_index.remove_rule_set(rule_set_id)
+
+        unchanged = set()
+        for rule_set_id, rule_set in data['rule_sets'].items():
+            digest = rule_set_digest(rule_set)
+            self.rule_set_digests[rule_set_id] = digest
+            if previous and previous.rule_set_digests.get(rule_set_id) == digest:
+                unchanged.add(rule_set_id)
+                self.compiled_rule_sets[rule_set_id] = previous.compiled_rule_sets[rule_set_id]
+                self.rule_indexes[rule_set_id] = previous.rule_indexes[rule_set_id]
+            else:
+                # One tokenizer pass per changed rule set, shared by the index, compiler and tag index
+                rule_index = RuleSetIndex(rule_set['rules'])
+                self.rule_indexes[rule_set_id] = rule_index
+                self.compiled_rule_sets[rule_set_id] = CompiledRuleSet(rule_set['rules'], rule_index)
+                self.tag_index.add_rule_set(rule_set_id, rule_set['rules'], rule_index.tokens)
+
+        # Prompt prefixes are rendered on first use per (rule set, positions of the relevant rules);
+        # keys start with the rule set id
+        self.prompt_prefixes: Dict[tuple, str] = {}
+        self.batch_prompt_prefixes: Dict[tuple, str] = {}
+        if previous:
+            # dict() copies atomically while evaluations on the old snapshot may still add prefixes
+            self.prompt_prefixes = {key: prefix for key, prefix in dict(previous.prompt_prefixes).items()
+                                    if key[0] in unchanged}
+            self.batch_prompt_prefixes = {key: prefix for key, prefix in dict(previous.batch_prompt_prefixes).items()
+                                          if key[0] in unchanged}
+
+    def stale_digests(self, previous: Optional['RuleSnapshot']) -> Set[str]:
+        """Digests of the previous snapshot's rule sets that no longer exist in this one"""
+        if previous is None:
+            return set()
+        return set(previous.rule_set_digests.values()) - set(self.rule_set_digests.values())
+
+
+class RulesFileWatcher:
+    """
+    Calls on_change when the rules file may have changed.
+
+    Uses filesystem notifications through the optional watchdog package (inotify on
+    Linux) and falls back to polling the file's mtime. on_change is expected to check
+    for itself whether the content really changed.
+    """
+
+    def __init__(self, rules_file: str, on_change: Callable[[], Any], interval: float = 1.0):
+        self.rules_file = os.path.abspath(rules_file)
+        self.on_change = on_change
+        self.interval = interval
+        self._stop = threading.Event()
+        self._observer = None
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """Start watching in the background"""
+        if Observer is not None:
+            try:
+                self._observer = Observer()
+                # Watch the directory so editors that replace the file by rename are seen
+                self._observer.schedule(self, os.path.dirname(self.rules_file), recursive=False)
+                self._observer.daemon = True
+                self._observer.start()
+                return
+            except Exception:
+                self._observer = None
+
+        self._thread = threading.Thread(target=self._poll, name="rules-file-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop watching"""
+        self._stop.set()
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join()
+            self._observer = None
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def dispatch(self, event):
+        """watchdog event callback"""
+        paths = (getattr(event, 'src_path', None), getattr(event, 'dest_path', None))
+        # SQLite rule stores in WAL mode change the -wal file rather than the database
+        watched = (self.rules_file, self.rules_file + '-wal')
+        if any(path and os.path.abspath(os.fsdecode(path)) in watched for path in paths):
+            self._notify()
+
+    def _poll(self):
+        while not self._stop.wait(self.interval):
+            self._notify()
+
+    def _notify(self):
+        try:
+            self.on_change()
+        except Exception:
+            # A broken edit must not kill the watcher; the old rules stay in effect
+            pass
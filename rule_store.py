@@ -0,0 +1,444 @@
+import csv
+import io
+import json
+import os
+import sqlite3
+import hashlib
+import tempfile
+import threading
+from typing import Dict, Any, Optional, Iterable, Iterator, Tuple, Union
+
+# A mapping of user -> rule set id, or a stream of (user, rule_set_id) pairs
+Assignments = Union[Dict[str, str], Iterable[Tuple[str, str]]]
+
+DEFAULT_RULES_DATA = {
+    "rule_sets": {},
+    "user_assignments": {},
+    "global_parameters": {},
+    "feature_definitions": {}
+}
+
+
+def empty_rules_data() -> Dict[str, Any]:
+    """A new, empty rules document"""
+    return json.loads(json.dumps(DEFAULT_RULES_DATA))
+
+
+def write_json_atomically(path: str, data: Dict[str, Any]) -> bytes:
+    """
+    Write a rules document so readers see either the old or the new file, never a
+    partial one: write a temp file in the same directory, fsync it, then rename it
+    over the target. Returns the bytes written.
+    """
+    content = json.dumps(data, indent=4).encode('utf-8')
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(prefix='.' + os.path.basename(path) + '.', suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            file.write(content)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+    return content
+
+
+class JsonRuleStore:
+    """
+    Rules kept in a single JSON file (the original format).
+
+    Every change rewrites the whole document, atomically. The incremental methods
+    take the full document after the change so they can be swapped with
+    SQLiteRuleStore, which writes only the affected rows.
+    """
+
+    def __init__(self, rules_file: str):
+        self.rules_file = rules_file
+        self.watch_path = rules_file
+        self._stat = None
+        self._hash = None
+
+    def _file_stat(self) -> Optional[tuple]:
+        try:
+            stat = os.stat(self.rules_file)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def _remember(self, content: Optional[bytes]):
+        self._stat = self._file_stat()
+        self._hash = hashlib.sha256(content).hexdigest() if content is not None else None
+
+    def load(self) -> Optional[Dict[str, Any]]:
+        """Read the rules document, or None if the file does not exist"""
+        try:
+            with open(self.rules_file, 'rb') as file:
+                content = file.read()
+        except FileNotFoundError:
+            self._remember(None)
+            return None
+        data = json.loads(content)
+        self._remember(content)
+        return data
+
+    def has_changed(self) -> bool:
+        """
+        Whether someone else changed the file since it was last loaded or saved.
+        Only a stat() is done when the file is untouched; the content hash is
+        compared when its mtime or size moved.
+        """
+        current_stat = self._file_stat()
+        if current_stat == self._stat:
+            return False
+        try:
+            with open(self.rules_file, 'rb') as file:
+                content = file.read()
+        except FileNotFoundError:
+            return False
+        if hashlib.sha256(content).hexdigest() == self._hash:
+            self._stat = current_stat
+            return False
+        return True
+
+    def save(self, data: Dict[str, Any]):
+        """Replace the whole rules document"""
+        self._remember(write_json_atomically(self.rules_file, data))
+
+    def put_rule_set(self, rule_set_id: str, rule_set: Dict[str, Any], data: Dict[str, Any]):
+        self.save(data)
+
+    def delete_rule_set(self, rule_set_id: str, data: Dict[str, Any]):
+        self.save(data)
+
+    def put_assignments(self, assignments: Assignments, data: Dict[str, Any]):
+        # data already holds the assignments; a streamed iterator is drained first
+        # so an error raised while reading it aborts before anything is written
+        for _ in assignments:
+            pass
+        self.save(data)
+
+    def delete_assignments(self, users: Iterable[str], data: Dict[str, Any]):
+        self.save(data)
+
+    def put_setting(self, key: str, value: Any, data: Dict[str, Any]):
+        self.save(data)
+
+    def export_json(self, path: str):
+        """Write the rules document to a JSON file"""
+        write_json_atomically(path, self.load() or empty_rules_data())
+
+
+class SQLiteRuleStore:
+    """
+    Rules kept in SQLite: one row per rule set, rule and user assignment, so a change
+    touches only its own rows inside one transaction. Other top-level keys of the
+    rules document (global_parameters, feature_definitions, ...) are stored as JSON
+    values in a settings table. A revision counter lets other processes detect changes.
+    """
+
+    def __init__(self, db_file: str = 'agentic_rules.db'):
+        self.db_file = db_file
+        self.watch_path = db_file
+        self._revision = None
+        self._lock = threading.Lock()
+        self.init_database()
+
+    def connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_file, timeout=30)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA foreign_keys=ON')
+        return conn
+
+    def init_database(self):
+        """Initialize SQLite tables for rules"""
+        conn = self.connect()
+        conn.executescript('''
+            CREATE TABLE IF NOT EXISTS rule_sets (
+                rule_set_id TEXT PRIMARY KEY,
+                name TEXT NOT NULL,
+                attributes TEXT
+            );
+            CREATE TABLE IF NOT EXISTS rules (
+                rule_set_id TEXT NOT NULL REFERENCES rule_sets (rule_set_id) ON DELETE CASCADE,
+                position INTEGER NOT NULL,
+                rule TEXT NOT NULL,
+                PRIMARY KEY (rule_set_id, position)
+            );
+            CREATE TABLE IF NOT EXISTS user_assignments (
+                user_id TEXT PRIMARY KEY,
+                rule_set_id TEXT NOT NULL REFERENCES rule_sets (rule_set_id) ON DELETE CASCADE
+            );
+            CREATE INDEX IF NOT EXISTS idx_user_assignments_rule_set ON user_assignments (rule_set_id);
+            CREATE TABLE IF NOT EXISTS settings (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+            CREATE TABLE IF NOT EXISTS store_meta (
+                key TEXT PRIMARY KEY,
+                value INTEGER
+            );
+            INSERT OR IGNORE INTO store_meta (key, value) VALUES ('revision', 0);
+        ''')
+        conn.commit()
+        conn.close()
+
+    def _write(self, statements):
+        """Run (sql, rows) pairs in one transaction and bump the revision"""
+        with self._lock:
+            conn = self.connect()
+            try:
+                conn.execute('BEGIN IMMEDIATE')
+                for sql, rows in statements:
+                    conn.executemany(sql, rows)
+                conn.execute("UPDATE store_meta SET value = value + 1 WHERE key = 'revision'")
+                revision = conn.execute("SELECT value FROM store_meta WHERE key = 'revision'").fetchone()[0]
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+            finally:
+                conn.close()
+            # Our own writes are already in memory; only other writers count as changes
+            if self._revision is not None and revision == self._revision + 1:
+                self._revision = revision
+
+    def _current_revision(self) -> int:
+        conn = self.connect()
+        try:
+            return conn.execute("SELECT value FROM store_meta WHERE key = 'revision'").fetchone()[0]
+        finally:
+            conn.close()
+
+    def is_empty(self) -> bool:
+        """True if nothing was ever stored"""
+        conn = self.connect()
+        try:
+            return conn.execute('SELECT NOT EXISTS (SELECT 1 FROM rule_sets) AND NOT EXISTS (SELECT 1 FROM settings)').fetchone()[0] == 1
+        finally:
+            conn.close()
+
+    def load(self) -> Optional[Dict[str, Any]]:
+        """Read the rules document in the JSON shape, or None if the store is empty"""
+        conn = self.connect()
+        try:
+            conn.execute('BEGIN')
+            revision = conn.execute("SELECT value FROM store_meta WHERE key = 'revision'").fetchone()[0]
+            rule_set_rows = conn.execute('SELECT rule_set_id, name, attributes FROM rule_sets ORDER BY rowid').fetchall()
+            rule_rows = conn.execute('SELECT rule_set_id, rule FROM rules ORDER BY rule_set_id, position').fetchall()
+            assignment_rows = conn.execute('SELECT user_id, rule_set_id FROM user_assignments ORDER BY rowid').fetchall()
+            setting_rows = conn.execute('SELECT key, value FROM settings ORDER BY rowid').fetchall()
+            conn.commit()
+        finally:
+            conn.close()
+
+        self._revision = revision
+        if not rule_set_rows and not setting_rows:
+            return None
+
+        rules_by_set: Dict[str, list] = {}
+        for rule_set_id, rule in rule_rows:
+            rules_by_set.setdefault(rule_set_id, []).append(rule)
+
+        rule_sets = {}
+        for rule_set_id, name, attributes in rule_set_rows:
+            rule_set = {"name": name, "rules": rules_by_set.get(rule_set_id, [])}
+            if attributes:
+                rule_set.update(json.loads(attributes))
+            rule_sets[rule_set_id] = rule_set
+
+        data = {"rule_sets": rule_sets, "user_assignments": dict(assignment_rows)}
+        for key, value in setting_rows:
+            data[key] = json.loads(value)
+        return data
+
+    def has_changed(self) -> bool:
+        """Whether another writer changed the rules since they were last loaded"""
+        return self._current_revision() != self._revision
+
+    def _rule_set_statements(self, rule_set_id: str, rule_set: Dict[str, Any]) -> list:
+        attributes = {key: value for key, value in rule_set.items() if key not in ('name', 'rules')}
+        return [
+            ('INSERT INTO rule_sets (rule_set_id, name, attributes) VALUES (?, ?, ?) '
+             'ON CONFLICT (rule_set_id) DO UPDATE SET name = excluded.name, attributes = excluded.attributes',
+             [(rule_set_id, rule_set['name'], json.dumps(attributes) if attributes else None)]),
+            ('DELETE FROM rules WHERE rule_set_id = ?', [(rule_set_id,)]),
+            ('INSERT INTO rules (rule_set_id, position, rule) VALUES (?, ?, ?)',
+             [(rule_set_id, position, rule) for position, rule in enumerate(rule_set['rules'])]),
+        ]
+
+    def _setting_statement(self, items) -> tuple:
+        return ('INSERT INTO settings (key, value) VALUES (?, ?) '
+                'ON CONFLICT (key) DO UPDATE SET value = excluded.value',
+                [(key, json.dumps(value)) for key, value in items])
+
+    def save(self, data: Dict[str, Any]):
+        """Replace the whole rules document"""
+        statements = [
+            ('DELETE FROM user_assignments', [()]),
+            ('DELETE FROM rules', [()]),
+            ('DELETE FROM rule_sets', [()]),
+            ('DELETE FROM settings', [()]),
+        ]
+        for rule_set_id, rule_set in data['rule_sets'].items():
+            statements.extend(self._rule_set_statements(rule_set_id, rule_set))
+        statements.append(('INSERT INTO user_assignments (user_id, rule_set_id) VALUES (?, ?)',
+                           list(data['user_assignments'].items())))
+        statements.append(self._setting_statement(
+            (key, value) for key, value in data.items() if key not in ('rule_sets', 'user_assignments')))
+        self._write(statements)
+
+    def put_rule_set(self, rule_set_id: str, rule_set: Dict[str, Any], data: Optional[Dict[str, Any]] = None):
+        """Insert or replace one rule set"""
+        self._write(self._rule_set_statements(rule_set_id, rule_set))
+
+    def delete_rule_set(self, rule_set_id: str, data: Optional[Dict[str, Any]] = None):
+        """Delete a rule set together with its rules and user assignments"""
+        self._write([('DELETE FROM rule_sets WHERE rule_set_id = ?', [(rule_set_id,)])])
+
+    def put_assignments(self, assignments: Assignments, data: Optional[Dict[str, Any]] = None):
+        """
+        Assign users to rule sets in one transaction. Pairs from an iterator are
+        streamed into SQLite; if the iterator raises, nothing is written.
+        """
+        rows = assignments.items() if isinstance(assignments, dict) else assignments
+        self._write([('INSERT INTO user_assignments (user_id, rule_set_id) VALUES (?, ?) '
+                      'ON CONFLICT (user_id) DO UPDATE SET rule_set_id = excluded.rule_set_id',
+                      rows)])
+
+    def delete_assignments(self, users: Iterable[str], data: Optional[Dict[str, Any]] = None):
+        """Remove user assignments"""
+        self._write([('DELETE FROM user_assignments WHERE user_id = ?', [(user,) for user in users])])
+
+    def put_setting(self, key: str, value: Any, data: Optional[Dict[str, Any]] = None):
+        """Set a top-level value such as global_parameters or project_location"""
+        self._write([self._setting_statement([(key, value)])])
+
+    def import_json(self, path: str):
+        """Replace the stored rules with the contents of a JSON rules file"""
+        with open(path, 'r') as file:
+            self.save(json.load(file))
+
+    def export_json(self, path: str):
+        """Write the stored rules to a JSON file in the original format"""
+        write_json_atomically(path, self.load() or empty_rules_data())
+
+
+def iter_assignments(stream, file_format: str = 'csv') -> Iterator[Tuple[str, str]]:
+    """
+    Read (user, rule_set_id) pairs from a CSV or JSONL stream, one row at a time.
+
+    CSV rows are "user,rule_set_id" with an optional header row; JSONL lines are
+    objects with "user" (or "user_id") and "rule_set_id". Binary streams are
+    decoded as UTF-8.
+    """
+    if isinstance(stream.read(0), bytes):
+        stream = io.TextIOWrapper(stream, encoding='utf-8')
+
+    if file_format == 'jsonl':
+        for line_number, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            user = record.get('user', record.get('user_id'))
+            if not user or not record.get('rule_set_id'):
+                raise ValueError(f"Line {line_number}: expected 'user' and 'rule_set_id'")
+            yield str(user).strip(), str(record['rule_set_id']).strip()
+    elif file_format == 'csv':
+        for row_number, row in enumerate(csv.reader(stream), 1):
+            if not row or not any(cell.strip() for cell in row):
+                continue
+            if len(row) < 2:
+                raise ValueError(f"Row {row_number}: expected user,rule_set_id")
+            user, rule_set_id = row[0].strip(), row[1].strip()
+            if row_number == 1 and user.lower() in ('user', 'user_id') and rule_set_id.lower() == 'rule_set_id':
+                continue
+            yield user, rule_set_id
+    else:
+        raise ValueError(f"Unsupported assignment format: {file_format}")
+
+
+def apply_assignments(store, data: Dict[str, Any], assignments: Assignments) -> Dict[str, Any]:
+    """
+    Validate and persist a bulk user assignment in one store write.
+
+    data['user_assignments'] is updated in place, so callers pass a copy and keep it
+    only on success. A mapping is validated completely before anything is written;
+    a stream is validated as it is written and the write is rolled back if any row
+    names an unknown rule set, so the whole stream never has to be held separately.
+    """
+    rule_sets = data['rule_sets']
+    if isinstance(assignments, dict):
+        invalid = sorted({rule_set_id for rule_set_id in assignments.values() if rule_set_id not in rule_sets})
+        if invalid:
+            return {
+                "success": False,
+                "assigned": 0,
+                "invalid_rule_sets": invalid,
+                "message": f"❌ Unknown rule set(s): {', '.join(invalid)}"
+            }
+        data['user_assignments'].update(assignments)
+        store.put_assignments(assignments, data)
+        return {
+            "success": True,
+            "assigned": len(assignments),
+            "invalid_rule_sets": [],
+            "message": f"✅ Assigned {len(assignments)} user(s)"
+        }
+
+    invalid = set()
+    assigned = 0
+
+    def valid_rows():
+        nonlocal assigned
+        for user, rule_set_id in assignments:
+            if rule_set_id not in rule_sets:
+                invalid.add(rule_set_id)
+            elif not invalid:
+                data['user_assignments'][user] = rule_set_id
+                assigned += 1
+                yield user, rule_set_id
+        if invalid:
+            # Raised inside the write so the transaction is rolled back
+            raise ValueError(f"Unknown rule set(s): {', '.join(sorted(invalid))}")
+
+    try:
+        store.put_assignments(valid_rows(), data)
+    except ValueError as e:
+        return {
+            "success": False,
+            "assigned": 0,
+            "invalid_rule_sets": sorted(invalid),
+            "message": f"❌ {e}"
+        }
+    return {
+        "success": True,
+        "assigned": assigned,
+        "invalid_rule_sets": [],
+        "message": f"✅ Assigned {assigned} user(s)"
+    }
+
+
+def open_rule_store(rules_file: str):
+    """SQLite store for .db/.sqlite paths, JSON file store otherwise"""
+    if os.path.splitext(rules_file)[1].lower() in ('.db', '.sqlite', '.sqlite3'):
+        return SQLiteRuleStore(rules_file)
+    return JsonRuleStore(rules_file)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Move rules between JSON files and SQLite rule stores")
+    parser.add_argument('command', choices=['import', 'export'])
+    parser.add_argument('db_file', help="SQLite rule store, e.g. agentic_rules.db")
+    parser.add_argument('json_file', help="JSON rules file, e.g. agentic_rules.json")
+    args = parser.parse_args()
+
+    store = SQLiteRuleStore(args.db_file)
+    if args.command == 'import':
+        store.import_json(args.json_file)
+    else:
+        store.export_json(args.json_file)
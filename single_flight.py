@@ -0,0 +1,124 @@
+import asyncio
+import threading
+from concurrent.futures import Future, CancelledError
+from typing import Dict, Any, Callable, Awaitable, Iterator
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key: the first caller runs the function,
+    later callers wait for its result instead of starting their own call.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._in_flight: Dict[str, Future] = {}
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        """Run fn once for all concurrent callers with the same key"""
+        with self._lock:
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._in_flight[key] = future
+
+        if not leader:
+            return future.result()
+
+        try:
+            result = fn()
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+
+    def stream(self, key: str, fn: Callable[[], Iterator[Any]]) -> Iterator[Any]:
+        """
+        Streaming counterpart of do: the first caller iterates fn() and receives every
+        item, later callers with the same key receive only its last item.
+
+        If the first caller stops iterating early, a waiting caller takes over.
+        Keys must not be shared with do().
+        """
+        while True:
+            with self._lock:
+                future = self._in_flight.get(key)
+                leader = future is None
+                if leader:
+                    future = Future()
+                    self._in_flight[key] = future
+
+            if leader:
+                break
+            try:
+                last = future.result()
+            except CancelledError:
+                continue
+            yield last
+            return
+
+        last = None
+        items = None
+        try:
+            items = fn()
+            for item in items:
+                last = item
+                yield item
+            future.set_result(last)
+        except GeneratorExit:
+            with self._lock:
+                self._in_flight.pop(key, None)
+            future.cancel()
+            if hasattr(items, 'close'):
+                items.close()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                if self._in_flight.get(key) is future:
+                    del self._in_flight[key]
+
+    def in_flight(self) -> int:
+        """Number of keys currently being computed"""
+        with self._lock:
+            return len(self._in_flight)
+
+
+class AsyncSingleFlight:
+    """asyncio counterpart of SingleFlight for coroutine functions"""
+
+    def __init__(self):
+        self._in_flight: Dict[str, asyncio.Task] = {}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Await fn once for all concurrent callers with the same key on this event loop.
+
+        fn runs as a task of its own, so cancelling any caller, the first one
+        included, leaves the shared call running for the others.
+        """
+        loop = asyncio.get_running_loop()
+        task = self._in_flight.get(key)
+        if task is None or task.get_loop() is not loop:
+            task = loop.create_task(fn())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._finished(key, done))
+        return await asyncio.shield(task)
+
+    def _finished(self, key: str, task: asyncio.Task):
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        # Mark the exception as retrieved when every caller was cancelled
+        if not task.cancelled():
+            task.exception()
+
+    def in_flight(self) -> int:
+        """Number of keys currently being computed"""
+        return len(self._in_flight)
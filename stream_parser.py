@@ -0,0 +1,72 @@
+import json
+import re
+from typing import Dict, Any, Optional
+
+# Line-based format: the Decision line comes first
+TEXT_DECISION = re.compile(r'^\s*\**Decision:?\**\s*:?\s*\[?(ALLOWED|DENIED)\b', re.MULTILINE)
+TEXT_RULE_VIOLATED = "Rule Violated"
+TEXT_REASON = re.compile(r'^\s*\**Reason:?\**\s*:?\s*(.*?)(?=\n\s*\**Rule Violated|\Z)', re.MULTILINE | re.DOTALL)
+
+# JSON format: fields are generated in schema order, decision and confidence first
+JSON_DECISION = re.compile(r'"decision"\s*:\s*"(ALLOWED|DENIED)"')
+# The number only counts once a delimiter shows it is complete
+JSON_CONFIDENCE = re.compile(r'"confidence_score"\s*:\s*(-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?)\s*[,}]')
+JSON_REASON = re.compile(r'"reason"\s*:\s*"((?:[^"\\]|\\.)*)')
+
+
+class EvaluationStreamParser:
+    """
+    Incrementally parses a streamed evaluation response so the decision can be
+    acted on before the reason has finished generating.
+    """
+
+    def __init__(self, structured: bool, need_confidence: bool = False):
+        self.structured = structured
+        # When tiering, the decision is only usable together with its confidence score
+        self.need_confidence = need_confidence and structured
+        self.text = ""
+        self.decision: Optional[Dict[str, Any]] = None
+
+    def feed(self, delta: str) -> Optional[Dict[str, Any]]:
+        """Add streamed text; returns the early decision the first time it is complete"""
+        self.text += delta
+        if self.decision is not None:
+            return None
+
+        match = (JSON_DECISION if self.structured else TEXT_DECISION).search(self.text)
+        if not match:
+            return None
+
+        decision = {"decision": match.group(1)}
+        if self.structured:
+            confidence = JSON_CONFIDENCE.search(self.text)
+            if confidence:
+                decision["confidence_score"] = float(confidence.group(1))
+            elif self.need_confidence:
+                return None
+        self.decision = decision
+        return decision
+
+    def reason(self) -> str:
+        """The reason text generated so far"""
+        if not self.structured:
+            match = TEXT_REASON.search(self.text)
+            if not match:
+                return ""
+            # Hold back a last line that may still turn out to be the Rule Violated line
+            head, newline, last = match.group(1).rpartition('\n')
+            if newline and TEXT_RULE_VIOLATED.startswith(last.strip().lstrip('*')):
+                return head.strip()
+            return match.group(1).strip()
+
+        match = JSON_REASON.search(self.text)
+        if not match:
+            return ""
+        raw = match.group(1)
+        # Drop a trailing escape whose second half has not arrived yet
+        if raw.endswith('\\') and not raw.endswith('\\\\'):
+            raw = raw[:-1]
+        try:
+            return json.loads(f'"{raw}"')
+        except json.JSONDecodeError:
+            return raw
@@ -0,0 +1,136 @@
+import re
+from typing import Dict, List, Optional, Set, Tuple
+
+# One pass over a rule: every bracketed tag, noting whether it directly follows
+# "can be" / "can only be", which marks it as the action of the rule's feature
+TAG_TOKEN = re.compile(r'(\bcan(?:\s+only)?\s+be\s+)?\[([A-Z][A-Z0-9_-]*)\]')
+
+# (rule_set_id, position of the rule in its rule set)
+RuleId = Tuple[str, int]
+
+# (feature, action, parameters) of one rule
+TokenizedRule = Tuple[Optional[str], Optional[str], List[str]]
+
+
+def tokenize_rule(rule: str) -> TokenizedRule:
+    """
+    Split a rule's tags into (feature, action, parameters). This is the only
+    tokenizer: the rule index, the rule compiler and TagIndex all use its output.
+
+    The first tag is the feature; the second is its action when introduced by
+    "can be"/"can only be"; every other tag is a parameter.
+    """
+    feature = action = None
+    parameters = []
+    for position, match in enumerate(TAG_TOKEN.finditer(rule)):
+        tag = match.group(2)
+        if position == 0:
+            feature = tag
+        elif position == 1 and match.group(1):
+            action = tag
+        elif tag not in parameters:
+            parameters.append(tag)
+    return feature, action, parameters
+
+
+class TagIndex:
+    """
+    Typed index of the tags used by all rule sets:
+    feature -> action (None for rules without one) -> parameter -> rule ids.
+
+    Built once when rules load and updated per rule set, so adding a rule set
+    only tokenizes that rule set's rules.
+    """
+
+    def __init__(self):
+        self.features: Dict[str, Dict[Optional[str], Dict[str, Set[RuleId]]]] = {}
+        # feature -> action -> rule ids, including rules without parameters
+        self.feature_rules: Dict[str, Dict[Optional[str], Set[RuleId]]] = {}
+        # parameter -> rule ids, across all features
+        self.parameters: Dict[str, Set[RuleId]] = {}
+        # rule_set_id -> tokenized rules, used to remove a rule set again
+        self.rule_sets: Dict[str, List[TokenizedRule]] = {}
+
+    def copy(self) -> 'TagIndex':
+        """Independent copy, so a published index is never changed in place"""
+        index = TagIndex()
+        index.features = {feature: {action: {parameter: set(rule_ids) for parameter, rule_ids in parameters.items()}
+                                    for action, parameters in actions.items()}
+                          for feature, actions in self.features.items()}
+        index.feature_rules = {feature: {action: set(rule_ids) for action, rule_ids in actions.items()}
+                               for feature, actions in self.feature_rules.items()}
+        index.parameters = {parameter: set(rule_ids) for parameter, rule_ids in self.parameters.items()}
+        index.rule_sets = dict(self.rule_sets)
+        return index
+
+    def add_rule_set(self, rule_set_id: str, rules: List[str], tokens: Optional[List[TokenizedRule]] = None):
+        """Index the rules of one rule set (optionally already tokenized), replacing any previous version of it"""
+        if rule_set_id in self.rule_sets:
+            self.remove_rule_set(rule_set_id)
+
+        tokenized = tokens if tokens is not None else [tokenize_rule(rule) for rule in rules]
+        for position, (feature, action, parameters) in enumerate(tokenized):
+            if feature is None:
+                continue
+            rule_id = (rule_set_id, position)
+            self.feature_rules.setdefault(feature, {}).setdefault(action, set()).add(rule_id)
+            actions = self.features.setdefault(feature, {}).setdefault(action, {})
+            for parameter in parameters:
+                actions.setdefault(parameter, set()).add(rule_id)
+                self.parameters.setdefault(parameter, set()).add(rule_id)
+        self.rule_sets[rule_set_id] = tokenized
+
+    def remove_rule_set(self, rule_set_id: str):
+        """Drop a rule set's rules from the index"""
+        for position, (feature, action, parameters) in enumerate(self.rule_sets.pop(rule_set_id, [])):
+            if feature is None:
+                continue
+            rule_id = (rule_set_id, position)
+            self._discard(self.feature_rules[feature], action, rule_id)
+            if not self.feature_rules[feature]:
+                del self.feature_rules[feature]
+            for parameter in parameters:
+                self._discard(self.features[feature][action], parameter, rule_id)
+                self._discard(self.parameters, parameter, rule_id)
+            if not self.features[feature][action] and action not in self.feature_rules.get(feature, {}):
+                del self.features[feature][action]
+            if not self.features[feature]:
+                del self.features[feature]
+
+    @staticmethod
+    def _discard(mapping: dict, key, rule_id: RuleId):
+        rule_ids = mapping.get(key)
+        if rule_ids is not None:
+            rule_ids.discard(rule_id)
+            if not rule_ids:
+                del mapping[key]
+
+    def feature_names(self) -> List[str]:
+        """Tags used as the feature of at least one rule"""
+        return sorted(self.features)
+
+    def actions_for(self, feature: str) -> List[str]:
+        """Actions that rules define for a feature"""
+        return sorted(action for action in self.features.get(feature, {}) if action is not None)
+
+    def parameters_for(self, feature: str, action: Optional[str] = None) -> List[str]:
+        """Parameters that rules of a feature (optionally one action) refer to"""
+        actions = self.features.get(feature, {})
+        if action is not None:
+            actions = {key: value for key, value in actions.items() if key in (action, None)}
+        parameters = set()
+        for action_parameters in actions.values():
+            parameters.update(action_parameters)
+        return sorted(parameters)
+
+    def parameter_names(self) -> List[str]:
+        """Tags used as a parameter by any rule"""
+        return sorted(self.parameters)
+
+    def rules_for(self, feature: str, action: Optional[str] = None) -> Set[RuleId]:
+        """Ids of the rules headed by a feature (optionally one action)"""
+        rule_ids = set()
+        for rule_action, ids in self.feature_rules.get(feature, {}).items():
+            if action is None or rule_action in (action, None):
+                rule_ids.update(ids)
+        return rule_ids
@@ -0,0 +1,150 @@
+from datetime import datetime, time as dt_time
+
+import pytest
+
+from rule_compiler import CompiledRuleSet, compile_rule
+from rule_index import RuleSetIndex
+
+CHECK_IN = "[ATTENDANCE] can only be [CHECK-IN] after [TIME] 08:00."
+CHECK_OUT = "[ATTENDANCE] can only be [CHECK-OUT] before [TIME] 22:00."
+EXPENSE = "[EXPENSE] can only be [SUBMIT] if [AMOUNT] is less than 1,000."
+CATEGORY = "[EXPENSE] can only be [SUBMIT] if [CATEGORY] is one of Travel, Meals or Office."
+WEEKDAYS = "[LEAVE] can only be [REQUEST] on [DAY] weekdays."
+
+
+def decide(rules, feature, action, parameters):
+    result = CompiledRuleSet(rules).evaluate(feature, action, parameters)
+    return None if result is None else result['decision']
+
+
+@pytest.mark.parametrize("rule", [CHECK_IN, CHECK_OUT, EXPENSE, CATEGORY, WEEKDAYS,
+                                  "[SHIFT] can only be [START] during [TIME] 22:00 to 06:00."])
+def test_supported_rules_compile(rule):
+    assert compile_rule(rule) is not None
+
+
+@pytest.mark.parametrize("rule", [
+    "[ATTENDANCE] can only be [CHECK-IN] at [LOCATION] after [TIME] 08:00.",
+    "[EXPENSE] can only be [APPROVE] by [FINANCE_MANAGER] role users.",
+    "Managers may override any rule.",
+    "[EXPENSE] must be reasonable.",
+])
+def test_unsupported_rules_are_left_to_the_llm(rule):
+    assert compile_rule(rule) is None
+
+
+@pytest.mark.parametrize("clock, decision", [
+    ("07:59", "DENIED"),
+    ("08:00", "DENIED"),
+    ("08:01", "ALLOWED"),
+])
+def test_after_is_strict(clock, decision):
+    assert decide([CHECK_IN], "ATTENDANCE", "CHECK-IN", {"TIME": clock}) == decision
+
+
+@pytest.mark.parametrize("clock, decision", [
+    ("21:59", "ALLOWED"),
+    ("22:00", "DENIED"),
+])
+def test_before_is_strict(clock, decision):
+    assert decide([CHECK_OUT], "ATTENDANCE", "CHECK-OUT", {"TIME": clock}) == decision
+
+
+def test_time_accepts_datetime_and_time_values():
+    assert decide([CHECK_IN], "ATTENDANCE", "CHECK-IN", {"TIME": datetime(2024, 1, 1, 9, 30)}) == "ALLOWED"
+    assert decide([CHECK_IN], "ATTENDANCE", "CHECK-IN", {"TIME": dt_time(7, 0)}) == "DENIED"
+
+
+def test_window_wraps_midnight():
+    rule = "[SHIFT] can only be [START] during [TIME] 22:00 to 06:00."
+    assert decide([rule], "SHIFT", "START", {"TIME": "23:30"}) == "ALLOWED"
+    assert decide([rule], "SHIFT", "START", {"TIME": "05:00"}) == "ALLOWED"
+    assert decide([rule], "SHIFT", "START", {"TIME": "12:00"}) == "DENIED"
+
+
+@pytest.mark.parametrize("amount, decision", [
+    (999.99, "ALLOWED"),
+    (1000, "DENIED"),
+    ("$1,500", "DENIED"),
+    ("250", "ALLOWED"),
+])
+def test_numeric_threshold(amount, decision):
+    assert decide([EXPENSE], "EXPENSE", "SUBMIT", {"AMOUNT": amount}) == decision
+
+
+@pytest.mark.parametrize("amount", [float('nan'), float('inf'), "-inf", "NaN", True, "lots", None])
+def test_non_finite_or_missing_amounts_defer_to_the_llm(amount):
+    assert decide([EXPENSE], "EXPENSE", "SUBMIT", {"AMOUNT": amount}) is None
+
+
+def test_enum_membership_is_case_insensitive():
+    assert decide([CATEGORY], "EXPENSE", "SUBMIT", {"CATEGORY": "meals"}) == "ALLOWED"
+    assert decide([CATEGORY], "EXPENSE", "SUBMIT", {"CATEGORY": "Gifts"}) == "DENIED"
+
+
+def test_day_of_week():
+    assert decide([WEEKDAYS], "LEAVE", "REQUEST", {"DAY": "2024-01-03"}) == "ALLOWED"
+    assert decide([WEEKDAYS], "LEAVE", "REQUEST", {"DAY": "Saturday"}) == "DENIED"
+
+
+def test_all_applicable_rules_must_hold():
+    rules = [EXPENSE, CATEGORY]
+    assert decide(rules, "EXPENSE", "SUBMIT", {"AMOUNT": 10, "CATEGORY": "Travel"}) == "ALLOWED"
+    result = CompiledRuleSet(rules).evaluate("EXPENSE", "SUBMIT", {"AMOUNT": 10, "CATEGORY": "Gifts"})
+    assert result['decision'] == "DENIED" and result['rule_violated'] == CATEGORY
+
+
+def test_feature_and_action_are_normalized():
+    assert decide([EXPENSE], " expense ", "submit", {"AMOUNT": 5}) == "ALLOWED"
+
+
+def test_no_applicable_rule_defers_to_the_llm():
+    assert decide([EXPENSE], "EXPENSE", "APPROVE", {"AMOUNT": 5}) is None
+
+
+def test_uncompiled_rule_for_the_same_action_forces_the_llm():
+    rules = [EXPENSE, "[EXPENSE] can only be [SUBMIT] by [EMPLOYEE] role users."]
+    assert decide(rules, "EXPENSE", "SUBMIT", {"AMOUNT": 5}) is None
+
+
+def test_uncompiled_rule_for_another_action_does_not_force_the_llm():
+    rules = [EXPENSE, "[EXPENSE] can only be [APPROVE] by [FINANCE_MANAGER] role users."]
+    assert decide(rules, "EXPENSE", "SUBMIT", {"AMOUNT": 5}) == "ALLOWED"
+
+
+def test_untagged_rule_forces_the_llm_everywhere():
+    rules = [EXPENSE, "No actions are allowed during the audit freeze."]
+    assert decide(rules, "EXPENSE", "SUBMIT", {"AMOUNT": 5}) is None
+
+
+def test_free_form_rule_mentioning_the_feature_forces_the_llm():
+    rules = [EXPENSE, "Contractors may not use [EXPENSE] at all."]
+    assert decide(rules, "EXPENSE", "SUBMIT", {"AMOUNT": 5}) is None
+    assert decide(rules + [CHECK_IN], "ATTENDANCE", "CHECK-IN", {"TIME": "09:00"}) == "ALLOWED"
+
+
+def test_can_be_rules_are_scoped_to_their_action():
+    rules = [EXPENSE, "[EXPENSE] can be [APPROVE] by department heads."]
+    assert decide(rules, "EXPENSE", "SUBMIT", {"AMOUNT": 5}) == "ALLOWED"
+    assert decide(rules, "EXPENSE", "APPROVE", {"AMOUNT": 5}) is None
+
+
+def test_rule_of_another_feature_mentioning_the_feature_forces_the_llm():
+    rules = [EXPENSE, "[LEAVE] can only be [APPROVE] unless [EXPENSE] reports are overdue."]
+    assert decide(rules, "EXPENSE", "SUBMIT", {"AMOUNT": 5}) is None
+
+
+@pytest.mark.parametrize("feature, action", [
+    ("EXPENSE", "SUBMIT"), ("EXPENSE", "APPROVE"), ("ATTENDANCE", "CHECK-IN"), ("ATTENDANCE", "CHECK-OUT"),
+    ("LEAVE", "REQUEST"), ("LEAVE", "APPROVE"), ("TIME", "SUBMIT"), ("PURCHASE", "APPROVE"),
+])
+def test_local_decisions_agree_with_the_rules_sent_to_the_llm(feature, action):
+    rules = [CHECK_IN, CHECK_OUT, EXPENSE, WEEKDAYS,
+             "[EXPENSE] can be [APPROVE] by department heads.",
+             "[LEAVE] can only be [APPROVE] unless [ATTENDANCE] is incomplete.",
+             "[PURCHASE] must use an approved vendor."]
+    index = RuleSetIndex(rules)
+    compiled = CompiledRuleSet(rules, index)
+    applicable = {rule.rule for rule in compiled.compiled if (rule.feature, rule.action) == (feature, action)}
+    relevant = index.relevant_rules(feature, action)
+    assert compiled._needs_llm(feature, action) == any(rule not in applicable for rule in relevant)